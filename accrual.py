@@ -0,0 +1,113 @@
+import datetime
+
+import ledger
+import profiling
+from db import transaction
+from leave_service import JUNIOR_ENTITLEMENT, SENIOR_ENTITLEMENT, Result
+
+CHUNK_SIZE = 5000
+# Unused days above this are forfeited at year end.
+CARRY_FORWARD_CAP = 12
+
+# Staging rows for one chunk: balance and version as read under the write
+# lock, then the days forfeited and granted.
+_BATCH_TABLE = '''CREATE TEMP TABLE IF NOT EXISTS accrual_batch (
+    emp_code TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    forfeit INTEGER NOT NULL,
+    grant_days INTEGER NOT NULL
+)'''
+
+_YEAR_END_SELECT = '''
+    SELECT emp_code, leave_balance, balance_version, MAX(leave_balance - :cap, 0),
+           CASE WHEN join_date <= date(:new_year, '-365 days') THEN :senior ELSE :junior END
+    FROM Person P
+    WHERE emp_code > :after AND relieve_date IS NULL AND join_date < :new_year
+      AND EXISTS (SELECT 1 FROM BalanceLedger B
+                  WHERE B.emp_code = P.emp_code AND B.reason = 'opening' AND B.created_at < :new_year)
+      AND NOT EXISTS (SELECT 1 FROM BalanceLedger B WHERE B.emp_code = P.emp_code AND B.reason = :grant_reason)
+    ORDER BY emp_code LIMIT :limit'''
+
+# People past their first anniversary whose latest grant (account opening or
+# a year-end grant, dated 1 January) was made while they were still junior.
+_ANNIVERSARY_SELECT = '''
+    SELECT emp_code, leave_balance, balance_version, 0, :senior - :junior
+    FROM Person P
+    WHERE emp_code > :after AND relieve_date IS NULL AND join_date <= date(:today, '-365 days')
+      AND (SELECT MAX(CASE WHEN B.reason = 'opening' THEN date(B.created_at)
+                           ELSE substr(B.reason, 14) || '-01-01' END)
+           FROM BalanceLedger B
+           WHERE B.emp_code = P.emp_code AND (B.reason = 'opening' OR B.reason GLOB 'annual_grant:*'))
+          < date(P.join_date, '+365 days')
+      AND NOT EXISTS (SELECT 1 FROM BalanceLedger B WHERE B.emp_code = P.emp_code AND B.reason = 'anniversary')
+    ORDER BY emp_code LIMIT :limit'''
+
+
+def _post_batch(cur, count, forfeit_reason, grant_reason):
+    # Up to two ledger entries per person (forfeit, then grant) and one
+    # balance update, all set-based over the staged chunk.
+    cur.execute('''INSERT INTO BalanceLedger (emp_code, delta, reason, balance_after, version)
+                   SELECT emp_code, -forfeit, ?, balance - forfeit, version + 1
+                   FROM temp.accrual_batch WHERE forfeit > 0''', (forfeit_reason,))
+    cur.execute('''INSERT INTO BalanceLedger (emp_code, delta, reason, balance_after, version)
+                   SELECT emp_code, grant_days, ?, balance - forfeit + grant_days, version + 1 + (forfeit > 0)
+                   FROM temp.accrual_batch''', (grant_reason,))
+    cur.execute('''UPDATE Person SET leave_balance = B.balance - B.forfeit + B.grant_days,
+                                     balance_version = B.version + 1 + (B.forfeit > 0)
+                   FROM temp.accrual_batch B
+                   WHERE Person.emp_code = B.emp_code AND Person.balance_version = B.version''')
+    if cur.rowcount != count:
+        raise ledger.BalanceConflict("Balances changed during accrual.")
+
+
+def _run_chunks(select, params, forfeit_reason, grant_reason, chunk_size):
+    # Each chunk commits on its own; people already posted are filtered out by
+    # the select, so an interrupted run resumes where it stopped.
+    totals = {"people": 0, "forfeited": 0, "granted": 0}
+    after = ""
+    while True:
+        with transaction() as cur:
+            cur.execute(_BATCH_TABLE)
+            cur.execute("DELETE FROM temp.accrual_batch")
+            cur.execute("INSERT INTO temp.accrual_batch " + select, {**params, "after": after, "limit": chunk_size})
+            count, last, forfeited, granted = cur.execute(
+                "SELECT COUNT(*), MAX(emp_code), SUM(forfeit), SUM(grant_days) FROM temp.accrual_batch").fetchone()
+            if count:
+                _post_batch(cur, count, forfeit_reason, grant_reason)
+            cur.execute("DELETE FROM temp.accrual_batch")
+        if not count:
+            return totals
+        totals["people"] += count
+        totals["forfeited"] += forfeited
+        totals["granted"] += granted
+        after = last
+
+
+def year_end(year, chunk_size=CHUNK_SIZE, cap=CARRY_FORWARD_CAP):
+    # Closes leave year `year`: forfeits unused days above the cap and grants
+    # the entitlement for year + 1 based on experience on 1 January.
+    params = {"cap": cap, "new_year": f"{year + 1:04d}-01-01", "grant_reason": f"annual_grant:{year + 1}",
+              "senior": SENIOR_ENTITLEMENT, "junior": JUNIOR_ENTITLEMENT}
+    return _run_chunks(_YEAR_END_SELECT, params, f"carry_forward_cap:{year}", f"annual_grant:{year + 1}",
+                       chunk_size)
+
+
+def anniversaries(today=None, chunk_size=CHUNK_SIZE):
+    # Tops up people who passed one year of experience since their last grant
+    # from the junior to the senior entitlement.
+    today = today or datetime.date.today()
+    params = {"today": today.isoformat(), "senior": SENIOR_ENTITLEMENT, "junior": JUNIOR_ENTITLEMENT}
+    return _run_chunks(_ANNIVERSARY_SELECT, params, None, "anniversary", chunk_size)
+
+
+@profiling.timed
+def run(today=None, chunk_size=CHUNK_SIZE, cap=CARRY_FORWARD_CAP):
+    # Safe to schedule daily: the year end for the previous year runs once,
+    # anniversary top-ups as people become eligible.
+    today = today or datetime.date.today()
+    closed = year_end(today.year - 1, chunk_size, cap)
+    topped_up = anniversaries(today, chunk_size)
+    message = (f"Year end {today.year - 1}: {closed['people']} accounts, {closed['forfeited']} days forfeited, "
+               f"{closed['granted']} days granted. Anniversaries: {topped_up['people']} accounts topped up.")
+    return Result(True, message, {"year_end": closed, "anniversaries": topped_up})
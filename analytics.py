@@ -0,0 +1,149 @@
+import datetime
+import threading
+
+import profiling
+import workdays
+from db import connection, current_shard, fan_out
+from schema import LEAVE_CHUNK_BITS, change_counters
+
+METRICS = ("leaves", "days", "lop_days", "long_leaves", "new_days", "experienced_days")
+
+# Approved leave of one leave_id block grouped by department, month index
+# (year * 12 + month - 1) and whether the employee had under a year's
+# experience when the leave started. Grouping runs inside SQLite: pulling raw
+# rows into Python costs more per row than the whole aggregate.
+CHUNK_SQL = '''
+    SELECT P.dept_id,
+           CAST(substr(L.from_date, 1, 4) AS INTEGER) * 12 + CAST(substr(L.from_date, 6, 2) AS INTEGER) - 1,
+           COALESCE(julianday(L.from_date) - julianday(P.join_date) < 365, 0),
+           COUNT(*), SUM(L.days), SUM(CASE WHEN L.is_lop THEN L.days ELSE 0 END), SUM(COALESCE(L.is_long_leave, 0))
+    FROM AllLeaves L CROSS JOIN Person P ON P.emp_code = L.emp_code
+    WHERE L.leave_id >= ? AND L.leave_id < ? AND L.status = 'approved'
+    GROUP BY 1, 2, 3'''
+
+
+class _State:
+    # One per shard; its lock keeps shards refreshing in parallel.
+    def __init__(self):
+        self.person_counter = None
+        self.chunks = {}   # chunk name -> (counter, {(dept_id, month, is_new): (leaves, days, lop_days, long)})
+        self.totals = {}   # sum of every chunk's grid
+        self.lock = threading.Lock()
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def _add(totals, grid, sign):
+    for key, values in grid.items():
+        current = totals.get(key, (0, 0, 0, 0))
+        merged = tuple(a + sign * b for a, b in zip(current, values))
+        if merged[0]:
+            totals[key] = merged
+        else:
+            totals.pop(key, None)
+
+
+def _chunk_grid(conn, name):
+    start = int(name.split("/")[1]) << LEAVE_CHUNK_BITS
+    return {(row[0], row[1], row[2]): row[3:]
+            for row in conn.execute(CHUNK_SQL, (start, start + (1 << LEAVE_CHUNK_BITS)))}
+
+
+def _refresh(conn, state):
+    # Recompute only the leave_id blocks whose counter moved since the last
+    # call; a department move or join date change invalidates all.
+    person_counter = change_counters(conn, "Person")["Person"]
+    counters = change_counters(conn, "Leave/")
+    if person_counter != state.person_counter:
+        state.person_counter = person_counter
+        state.chunks = {}
+        state.totals = {}
+    for name, counter in counters.items():
+        cached = state.chunks.get(name)
+        if cached is not None and cached[0] == counter:
+            continue
+        grid = _chunk_grid(conn, name)
+        if cached is not None:
+            _add(state.totals, cached[1], -1)
+        _add(state.totals, grid, 1)
+        state.chunks[name] = (counter, grid)
+    return state.totals
+
+
+def _month_index(month):
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def _month_start(index):
+    # Ordinal of the first day of a month index.
+    year, month = divmod(index, 12)
+    return datetime.date(year, month + 1, 1).toordinal()
+
+
+def _summarize(rows, key):
+    groups = {}
+    for row in rows:
+        total = groups.setdefault(row[key], {key: row[key], **dict.fromkeys(METRICS, 0)})
+        for metric in METRICS:
+            total[metric] += row[metric]
+    return [groups[name] for name in sorted(groups)]
+
+
+def _shard_totals():
+    # Totals, headcount and calendars of the current shard.
+    with _states_lock:
+        state = _states.setdefault(current_shard(), _State())
+    with connection() as conn:
+        with state.lock:
+            totals = dict(_refresh(conn, state))
+        headcount = dict(conn.execute(
+            "SELECT dept_id, COUNT(*) FROM Person WHERE relieve_date IS NULL GROUP BY dept_id"))
+        calendars = {dept_id: workdays.calendar_for(conn, dept_id) for dept_id in headcount}
+    return totals, headcount, calendars
+
+
+@profiling.timed
+def leave_report(from_month=None, to_month=None):
+    # Approved leave per department and month (YYYY-MM bounds, inclusive),
+    # bucketed by the month the leave starts in. Shards are refreshed in
+    # parallel; a department lives in one shard, so their cells don't overlap.
+    parts = iter(fan_out(_shard_totals).values())
+    totals, headcount, calendars = next(parts)
+    for shard_totals, shard_headcount, shard_calendars in parts:
+        _add(totals, shard_totals, 1)
+        headcount.update(shard_headcount)
+        calendars.update(shard_calendars)
+
+    low = _month_index(from_month) if from_month else None
+    high = _month_index(to_month) if to_month else None
+    cells = {}
+    for (dept_id, month, is_new), (leaves, days, lop_days, long_leaves) in totals.items():
+        if (low is not None and month < low) or (high is not None and month > high):
+            continue
+        cell = cells.setdefault((dept_id, month), [0] * len(METRICS))
+        cell[0] += leaves
+        cell[1] += days
+        cell[2] += lop_days
+        cell[3] += long_leaves
+        cell[4 if is_new else 5] += days
+
+    rows = []
+    for (dept_id, month), values in sorted(cells.items()):
+        year, month_number = divmod(month, 12)
+        staff = headcount.get(dept_id, 0)
+        available = 0
+        if staff:
+            available = staff * calendars[dept_id].count(_month_start(month), _month_start(month + 1) - 1)
+        rows.append({"dept_id": dept_id, "month": f"{year:04d}-{month_number + 1:02d}",
+                     **dict(zip(METRICS, values)), "headcount": staff,
+                     # Share of the department's working person-days spent on approved leave.
+                     "utilization": round(values[1] / available, 4) if available else None})
+    return {"by_department_month": rows, "by_department": _summarize(rows, "dept_id"),
+            "by_month": _summarize(rows, "month")}
+
+
+def clear_cache():
+    with _states_lock:
+        _states.clear()
@@ -0,0 +1,59 @@
+import datetime
+import json
+
+import profiling
+from db import LEAVE_COLUMNS, transaction
+
+CHUNK_SIZE = 5000
+# Closed leaves that ended more than this many days ago move to the archive.
+HORIZON_DAYS = 365
+
+# Decided (non-pending) leaves that ended before the cutoff, walked in
+# leave_id order from the last chunk.
+_CANDIDATES = '''SELECT leave_id FROM main.Leave
+                 WHERE leave_id > ? AND status != 'pending' AND to_date < ?
+                 ORDER BY leave_id LIMIT ?'''
+
+
+def _reconcile(cur, leave_ids_json):
+    # Leaves present in both tiers: drop the hot copy when the archive copy
+    # matches, else drop the stale archive copy (the leave changed after it
+    # was copied) so the next run copies it again.
+    cur.execute('''DELETE FROM main.Leave
+                    WHERE leave_id IN (SELECT value FROM json_each(?))
+                      AND EXISTS (SELECT 1 FROM archive.Leave A
+                                  WHERE A.leave_id = Leave.leave_id AND A.status IS Leave.status
+                                    AND A.is_lop IS Leave.is_lop)''', (leave_ids_json,))
+    moved = cur.rowcount
+    cur.execute('''DELETE FROM archive.Leave
+                   WHERE leave_id IN (SELECT value FROM json_each(?))
+                     AND EXISTS (SELECT 1 FROM main.Leave M WHERE M.leave_id = Leave.leave_id)''', (leave_ids_json,))
+    return moved
+
+
+@profiling.timed
+def run(today=None, horizon_days=HORIZON_DAYS, chunk_size=CHUNK_SIZE):
+    # Each chunk is copied into the archive and deleted from the hot table in
+    # one transaction. WAL commits aren't atomic across attached files, so a
+    # crash mid-commit can still leave a row in both tiers, never in neither;
+    # AllLeaves shows only the hot copy of such a row and the next run
+    # settles them first.
+    today = today or datetime.date.today()
+    cutoff = (today - datetime.timedelta(days=horizon_days)).isoformat()
+    with transaction() as cur:
+        both = [row[0] for row in cur.execute(
+            """SELECT leave_id FROM main.Leave M
+               WHERE EXISTS (SELECT 1 FROM archive.Leave A WHERE A.leave_id = M.leave_id)""")]
+        moved = _reconcile(cur, json.dumps(both)) if both else 0
+
+    after = 0
+    while True:
+        with transaction() as cur:
+            leave_ids = [row[0] for row in cur.execute(_CANDIDATES, (after, cutoff, chunk_size))]
+            if not leave_ids:
+                return moved
+            cur.execute(f'''INSERT OR REPLACE INTO archive.Leave ({LEAVE_COLUMNS})
+                            SELECT {LEAVE_COLUMNS} FROM main.Leave
+                            WHERE leave_id IN (SELECT value FROM json_each(?))''', (json.dumps(leave_ids),))
+            moved += _reconcile(cur, json.dumps(leave_ids))
+        after = leave_ids[-1]
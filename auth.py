@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connection, transaction
+
+KDF = os.environ.get("LEAVE_MGMT_KDF", "scrypt")
+SCRYPT_N = int(os.environ.get("LEAVE_MGMT_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = int(os.environ.get("LEAVE_MGMT_PBKDF2_ITERATIONS", "600000"))
+SALT_BYTES = 16
+
+MAX_SESSIONS = 10000
+SESSION_TTL = 8 * 60 * 60
+
+# role -> (table, key column, extra filter)
+ROLES = {
+    "hr": ("HR", "hr_id", ""),
+    "employee": ("Person", "emp_code", " AND role='employee' AND relieve_date IS NULL"),
+    "head": ("Person", "emp_code", " AND role='head' AND relieve_date IS NULL"),
+}
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+_dummy_hash = None
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _derive(algorithm, params, salt, password):
+    if algorithm == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * n * r * p + 1024 * 1024, dklen=32)
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params[0])
+
+
+def _current_params():
+    if KDF == "scrypt":
+        return "scrypt", (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return "pbkdf2_sha256", (PBKDF2_ITERATIONS,)
+
+
+def hash_password(password):
+    algorithm, params = _current_params()
+    salt = os.urandom(SALT_BYTES)
+    digest = _derive(algorithm, params, salt, password)
+    return "$".join([algorithm, *map(str, params), _b64(salt), _b64(digest)])
+
+
+def hash_passwords(passwords, workers=4):
+    # hashlib releases the GIL while deriving, so threads give real parallelism.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def _parse(stored):
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        return "scrypt", tuple(int(x) for x in parts[1:4]), parts[4], parts[5]
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        return "pbkdf2_sha256", (int(parts[1]),), parts[2], parts[3]
+    return None
+
+
+def verify_password(stored, password):
+    # Returns (matches, needs_rehash). Every path runs exactly one KDF so that
+    # unknown users and legacy plaintext rows take as long as hashed ones.
+    global _dummy_hash
+    parsed = _parse(stored) if stored else None
+    if parsed is None:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password(secrets.token_hex(8))
+        verify_password(_dummy_hash, password)
+        matches = stored is not None and hmac.compare_digest(stored.encode(), password.encode())
+        return matches, matches
+    algorithm, params, salt, digest = parsed
+    actual = _derive(algorithm, params, base64.b64decode(salt), password)
+    matches = hmac.compare_digest(actual, base64.b64decode(digest))
+    return matches, matches and (algorithm, params) != _current_params()
+
+
+def _credentials(role, column, value):
+    table, key, condition = ROLES[role]
+    with connection() as conn:
+        return conn.execute(f"SELECT {key}, password FROM {table} WHERE {column}=?{condition}",
+                            (value,)).fetchone()
+
+
+def _upgrade_hash(role, user_id, old_stored, password):
+    # Lazy migration of plaintext (or outdated) hashes on successful login.
+    table, key, _ = ROLES[role]
+    with transaction() as cur:
+        cur.execute(f"UPDATE {table} SET password=? WHERE {key}=? AND password=?",
+                    (hash_password(password), user_id, old_stored))
+
+
+def check_credentials(role, username, password, by_id=False):
+    row = _credentials(role, ROLES[role][1] if by_id else "username", username)
+    matches, needs_rehash = verify_password(row[1] if row else None, password)
+    if not matches:
+        return None
+    if needs_rehash:
+        _upgrade_hash(role, row[0], row[1], password)
+    return row[0]
+
+
+def _start_session(role, user_id):
+    token = secrets.token_urlsafe(32)
+    with _sessions_lock:
+        _sessions[token] = (role, user_id, time.monotonic() + SESSION_TTL)
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    return token
+
+
+def login(role, username, password):
+    # Returns {"role", "user_id", "token"} or None.
+    user_id = check_credentials(role, username, password)
+    if user_id is None:
+        return None
+    return {"role": role, "user_id": user_id, "token": _start_session(role, user_id)}
+
+
+def resolve(token):
+    # (role, user_id) for a live session, without touching the KDF or the database.
+    with _sessions_lock:
+        session = _sessions.get(token)
+        if session is None:
+            return None
+        if session[2] < time.monotonic():
+            del _sessions[token]
+            return None
+        _sessions.move_to_end(token)
+        return session[0], session[1]
+
+
+def logout(token):
+    with _sessions_lock:
+        _sessions.pop(token, None)
+
+
+def end_sessions(role, user_id):
+    with _sessions_lock:
+        for token in [t for t, s in _sessions.items() if s[0] == role and s[1] == user_id]:
+            del _sessions[token]
@@ -0,0 +1,126 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+
+import auth
+import db
+import events
+import ledger
+from schema import PERSON_INSERT, create_tables, rebuild_leave_usage
+
+PASSWORD = "bench-password"
+LEAVE_TYPES = [("Casual", 50), ("Sick", 25), ("Earned", 20), ("Combo", 5)]
+# Most leaves are short; a few are long leaves (more than 4 days).
+LEAVE_LENGTHS = [(1, 45), (2, 20), (3, 12), (4, 8), (5, 6), (7, 4), (10, 3), (15, 2)]
+FIRST_EMP_CODE = 100000
+FIRST_HEAD_CODE = 900000
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _employee_leaves(rng, emp_code, join_date, today, count):
+    start_window = max(join_date, today - datetime.timedelta(days=3 * 365))
+    span = (today + datetime.timedelta(days=60) - start_window).days
+    if span <= 0 or count == 0:
+        return []
+    starts = sorted(rng.sample(range(span), min(count, span)))
+    leaves = []
+    free_from = 0
+    for offset in starts:
+        if offset < free_from:
+            continue
+        days = _weighted(rng, LEAVE_LENGTHS)
+        from_dt = start_window + datetime.timedelta(days=offset)
+        to_dt = from_dt + datetime.timedelta(days=days - 1)
+        free_from = offset + days
+        if from_dt > today:
+            status = "pending" if rng.random() < 0.6 else "approved"
+        else:
+            status = _weighted(rng, [("approved", 75), ("rejected", 12), ("cancelled", 13)])
+        leave_type = "Casual" if (today - join_date).days < 365 else _weighted(rng, LEAVE_TYPES)
+        leaves.append((emp_code, from_dt.isoformat(), to_dt.isoformat(), days, "Generated", leave_type,
+                       status, rng.random() < 0.05, days > 4))
+    return leaves
+
+
+def generate(path, departments=10, employees=1000, leaves_per_employee=20, seed=42):
+    db.configure(path)
+    # The database, its archive and submission spool sidecars, and their WAL files.
+    for base in (path, db.archive_path(path), os.path.splitext(path)[0] + "-spool.db"):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(base + suffix):
+                os.remove(base + suffix)
+    create_tables()
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    # One hash shared by every generated user keeps generation fast.
+    password = auth.hash_password(PASSWORD)
+
+    dept_ids = [f"D{i:03d}" for i in range(departments)]
+    with db.transaction() as cur:
+        cur.executemany("INSERT INTO HR VALUES (?, ?, ?, ?, ?)",
+                        [("HR0001", "Bench HR", "Manager", "bench_hr", password)])
+        cur.executemany("INSERT INTO Department VALUES (?, ?, ?)",
+                        [(dept_id, f"Department {i}", str(FIRST_HEAD_CODE + i)) for i, dept_id in enumerate(dept_ids)])
+        cur.executemany(PERSON_INSERT,
+                        [(str(FIRST_HEAD_CODE + i), f"Head {i}", f"Department {i}", "Head", "Head", dept_id,
+                          "2015-01-01", None, 36, "live", str(FIRST_HEAD_CODE + i), password, "Bench HR", "head")
+                         for i, dept_id in enumerate(dept_ids)])
+
+        people = []
+        leaves = []
+        for i in range(employees):
+            emp_code = str(FIRST_EMP_CODE + i)
+            dept = rng.randrange(departments)
+            # Roughly a fifth of the workforce joined within the last year.
+            join_date = today - datetime.timedelta(days=int(rng.expovariate(1 / 1200)))
+            count = int(rng.expovariate(1 / leaves_per_employee)) if leaves_per_employee else 0
+            emp_leaves = _employee_leaves(rng, emp_code, join_date, today, count)
+            balance = 36 if (today - join_date).days >= 365 else 12
+            used = sum(leave[3] for leave in emp_leaves if leave[6] == "approved" and not leave[7])
+            people.append((emp_code, f"Employee {i}", f"Department {dept}", "Staff", "Staff", dept_ids[dept],
+                           join_date.isoformat(), None, max(balance - used, 0), "live", emp_code, password,
+                           "Bench HR", "employee"))
+            leaves += emp_leaves
+            if len(leaves) >= 50000:
+                _insert_batch(cur, people, leaves)
+                people, leaves = [], []
+        _insert_batch(cur, people, leaves)
+        ledger.open_accounts(cur)
+        events.open_leaves(cur)
+        rebuild_leave_usage(cur)
+        cur.execute("ANALYZE")
+    with db.connection() as conn:
+        counts = conn.execute('''SELECT (SELECT COUNT(*) FROM Person WHERE role='employee'),
+                                        (SELECT COUNT(*) FROM Leave), (SELECT COUNT(*) FROM PendingInbox)''').fetchone()
+    return {"departments": departments, "employees": counts[0], "leaves": counts[1], "inbox": counts[2]}
+
+
+def _insert_batch(cur, people, leaves):
+    # People first: the PendingInbox triggers copy a leave only when its
+    # employee's row already exists.
+    cur.executemany(PERSON_INSERT, people)
+    cur.executemany('''INSERT INTO Leave (emp_code, from_date, to_date, days, reason, leave_type, status,
+                                          is_lop, is_long_leave)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', leaves)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a scratch leave database with synthetic data")
+    parser.add_argument("path", help="Scratch database file (overwritten)")
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--leaves-per-employee", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    print(generate(args.path, args.departments, args.employees, args.leaves_per_employee, args.seed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
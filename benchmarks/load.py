@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+
+import db
+import server
+from benchmarks.generate import PASSWORD, generate
+from benchmarks.run import git_revision, percentile
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection per simulated session.
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.token = None
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        headers = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(data)}\r\n"
+        if self.token:
+            headers += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(headers.encode() + b"\r\n" + data)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        length = next(int(line.split(":", 1)[1]) for line in lines if line.lower().startswith("content-length:"))
+        return status, json.loads(await self.reader.readexactly(length))
+
+
+async def session(host, port, emp_code, requests, rng, latencies, errors):
+    client = Client(host, port)
+    await client.open()
+    try:
+        status, payload = await client.request("POST", "/login", {"role": "employee", "username": emp_code,
+                                                                 "password": PASSWORD})
+        if status != 200:
+            errors.append(("login", status))
+            return
+        client.token = payload["data"]["token"]
+        for _ in range(requests):
+            if rng.random() < 0.2:
+                start = datetime.date.today() + datetime.timedelta(days=rng.randrange(90, 3000))
+                method, path = "POST", "/leaves"
+                body = {"from_date": start.isoformat(), "to_date": start.isoformat(), "leave_type": "Casual",
+                        "reason": "Load test"}
+            else:
+                method, path, body = "GET", "/leaves", None
+            began = time.perf_counter()
+            status, _ = await client.request(method, path, body)
+            latencies.append(time.perf_counter() - began)
+            if status >= 500:
+                errors.append((path, status))
+    finally:
+        await client.close()
+
+
+async def run_load(host, port, sessions, requests, seed):
+    with db.connection() as conn:
+        employees = [row[0] for row in conn.execute("SELECT emp_code FROM Person WHERE role='employee'")]
+    rng = random.Random(seed)
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    await asyncio.gather(*(session(host, port, rng.choice(employees), requests, random.Random(rng.random()),
+                                   latencies, errors) for _ in range(sessions)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 4),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def start_server(host, port, readers):
+    # Serve from a background thread with its own event loop.
+    ready = threading.Event()
+    holder = {}
+
+    def target():
+        loop = asyncio.new_event_loop()
+        holder["loop"] = loop
+
+        def started(srv):
+            holder["server"] = srv
+            ready.set()
+
+        task = loop.create_task(server.serve(host, port, readers, ready=started))
+        holder["task"] = task
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    ready.wait()
+    holder["thread"] = thread
+    return holder
+
+
+def stop_server(holder):
+    holder["loop"].call_soon_threadsafe(holder["task"].cancel)
+    holder["thread"].join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the HTTP API with concurrent sessions")
+    parser.add_argument("--db", default="bench_leave_mgmt.db", help="Scratch database file")
+    parser.add_argument("--reuse", action="store_true", help="Use the existing scratch database as is")
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--leaves-per-employee", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=300, help="Concurrent client sessions")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per session after login")
+    parser.add_argument("--readers", type=int, default=server.READ_WORKERS)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.reuse:
+        db.configure(args.db)
+        dataset = None
+    else:
+        dataset = generate(args.db, args.departments, args.employees, args.leaves_per_employee, args.seed)
+    db.configure(size=server.pool_size(args.readers))
+
+    holder = start_server("127.0.0.1", args.port, args.readers)
+    try:
+        result = asyncio.run(run_load("127.0.0.1", args.port, args.sessions, args.requests, args.seed))
+    finally:
+        stop_server(holder)
+        db.close_pool()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "dataset": dataset,
+        "load": result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import datetime
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import leave_service as service
+from benchmarks.generate import PASSWORD, generate
+
+
+class Context:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        with db.connection() as conn:
+            self.employees = [row[0] for row in conn.execute("SELECT emp_code FROM Person WHERE role='employee'")]
+            self.departments = [row[0] for row in conn.execute("SELECT dept_id FROM Department")]
+            self.heads = dict(conn.execute("SELECT dept_id, emp_code FROM Person WHERE role='head'"))
+        self.applied = []
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def next_dates(self):
+        with self.lock:
+            start = datetime.date.today() + datetime.timedelta(days=self.rng.randrange(90, 3000))
+            days = self.rng.choice([1, 1, 1, 2, 3])
+        return start.isoformat(), (start + datetime.timedelta(days=days - 1)).isoformat()
+
+
+def apply_leave(ctx):
+    emp_code = ctx.choice(ctx.employees)
+    from_date, to_date = ctx.next_dates()
+    result = service.apply_leave(emp_code, from_date, to_date, "Casual", "Benchmark")
+    if result.ok:
+        with ctx.lock:
+            ctx.applied.append((emp_code, result.data["leave_id"]))
+
+
+def cancel_leave(ctx):
+    with ctx.lock:
+        target = ctx.applied.pop() if ctx.applied else None
+    if target is None:
+        emp_code = ctx.choice(ctx.employees)
+        leaves = service.cancellable_leaves(emp_code)
+        if not leaves:
+            return
+        target = (emp_code, leaves[0][0])
+    service.cancel_leave(*target)
+
+
+def process_head_leaves(ctx):
+    dept_id = ctx.choice(ctx.departments)
+    rows = service.pending_leaves(dept_id)
+    service.decide_leaves(dept_id, [(row[0], ctx.rng.random() < 0.8) for row in rows[:50]])
+
+
+def view_all_leaves_hr(ctx):
+    rows, _ = service.leave_page(limit=50, dept_id=ctx.choice(ctx.departments))
+    return rows
+
+
+def stream_all_leaves(ctx):
+    for _ in service.iter_leaves(batch_size=1000, status="approved"):
+        pass
+
+
+def login_employee(ctx):
+    service.login_employee(ctx.choice(ctx.employees), PASSWORD)
+
+
+def login_head(ctx):
+    service.login_head(ctx.choice(list(ctx.heads.values())), PASSWORD)
+
+
+SCENARIOS = {
+    "apply_leave": apply_leave,
+    "cancel_leave": cancel_leave,
+    "process_head_leaves": process_head_leaves,
+    "view_all_leaves_hr": view_all_leaves_hr,
+    "stream_all_leaves": stream_all_leaves,
+    "login_employee": login_employee,
+    "login_head": login_head,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(ctx, operation, ops, threads):
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        operation(ctx)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(timed, range(ops)))
+    else:
+        latencies = [timed(i) for i in range(ops)]
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ops": ops,
+        "threads": threads,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(ops / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the leave workflows")
+    parser.add_argument("--db", default="bench_leave_mgmt.db", help="Scratch database file")
+    parser.add_argument("--reuse", action="store_true", help="Use the existing scratch database as is")
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--leaves-per-employee", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=200, help="Operations per scenario")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.reuse:
+        db.configure(args.db)
+        dataset = None
+    else:
+        dataset = generate(args.db, args.departments, args.employees, args.leaves_per_employee, args.seed)
+        # process_head_leaves would time empty inboxes and measure nothing.
+        if dataset["leaves"] and not dataset["inbox"]:
+            print("Generated data left every department's pending inbox empty.", file=sys.stderr)
+            return 1
+
+    ctx = Context(args.seed)
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "dataset": dataset,
+        "scenarios": {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        report["scenarios"][name] = run_scenario(ctx, SCENARIOS[name], args.ops, args.threads)
+    db.close_pool()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import csv
+import json
+import os
+import sqlite3
+from contextlib import ExitStack
+
+import auth
+import ledger
+import profiling
+from db import shard_for_dept, shard_names, transaction
+from leave_service import Result, initial_leave_balance, invalidate_metadata, parse_date, valid_name
+from schema import PERSON_INSERT
+
+BATCH_SIZE = 5000
+
+DEPARTMENT_INSERT = "INSERT INTO Department VALUES (?, ?, NULL)"
+
+
+def read_records(path):
+    # Yields (line_number, dict) pairs. CSV and JSON Lines are streamed; a .json
+    # file holding a single array is loaded whole.
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, row
+            return
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == "[":
+            f.seek(0)
+            for number, row in enumerate(json.load(f), start=1):
+                yield number, row
+            return
+        f.seek(0)
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def _text(row, key):
+    value = row.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def _is_yes(value):
+    return str(value).strip().lower() in ("yes", "y", "true", "1")
+
+
+class _Importer:
+    def __init__(self, cursors, hr_name):
+        # cursors: {shard: cursor}, one open transaction per shard. Rows go to
+        # their department's shard.
+        self.cursors = cursors
+        self.hr_name = hr_name
+        # Loaded once so every row is validated against in-memory sets.
+        self.dept_ids = set()
+        self.taken_codes = set()
+        for cur in cursors.values():
+            self.dept_ids.update(row[0] for row in cur.execute("SELECT dept_id FROM Department"))
+            self.taken_codes.update(row[0] for row in cur.execute(
+                "SELECT hr_id FROM HR UNION ALL SELECT emp_code FROM Person"))
+        self.departments = []
+        self.employees = []
+        self.heads = []
+        self.summary = {"departments": 0, "employees": 0, "heads": 0, "errors": []}
+
+    def add(self, number, row):
+        if not isinstance(row, dict):
+            error = "Malformed record."
+        elif _text(row, "emp_code"):
+            error = self._add_person(number, row)
+        elif _text(row, "dept_id"):
+            error = self._add_department(number, row)
+        else:
+            error = "Row is neither a department nor an employee."
+        if error:
+            self.summary["errors"].append((number, error))
+        if len(self.departments) + len(self.employees) + len(self.heads) >= BATCH_SIZE:
+            self.flush()
+
+    def _add_department(self, number, row):
+        dept_id, dept_name = _text(row, "dept_id"), _text(row, "dept_name")
+        if len(dept_id) != 4:
+            return "Department ID must be 4 characters."
+        if not dept_name:
+            return "Department Name is required."
+        if dept_id in self.dept_ids:
+            return "Department ID already exists."
+        self.dept_ids.add(dept_id)
+        self.departments.append((number, (dept_id, dept_name)))
+        return None
+
+    def _add_person(self, number, row):
+        emp_code = _text(row, "emp_code")
+        if not emp_code.isdigit() or len(emp_code) != 6:
+            return "Employee Code must be 6 digits."
+        if emp_code in self.taken_codes:
+            return "Employee code already exists."
+        name = _text(row, "name")
+        if not valid_name(name):
+            return "Invalid name."
+        dept_id = _text(row, "dept_id")
+        if dept_id not in self.dept_ids:
+            return "Department not created. Please create department first."
+        join_date = _text(row, "join_date")
+        try:
+            parse_date(join_date)
+        except ValueError:
+            return "Invalid date format."
+        password = _text(row, "password")
+        if not password:
+            return "Password is required."
+
+        self.taken_codes.add(emp_code)
+        is_head = _is_yes(row.get("is_head", ""))
+        values = (emp_code, name, _text(row, "department"), _text(row, "designation"), _text(row, "post"),
+                  dept_id, join_date, None, initial_leave_balance(join_date), 'live', emp_code, password,
+                  self.hr_name, "head" if is_head else "employee")
+        (self.heads if is_head else self.employees).append((number, values))
+        return None
+
+    def flush(self):
+        for batch in (self.employees, self.heads):
+            hashes = auth.hash_passwords([values[11] for _, values in batch])
+            batch[:] = [(number, values[:11] + (hashed,) + values[12:])
+                        for (number, values), hashed in zip(batch, hashes)]
+        departments = self._by_shard(self.departments, 0)
+        employees = self._by_shard(self.employees, 5)
+        heads = self._by_shard(self.heads, 5)
+        for shard, cur in self.cursors.items():
+            self._insert(cur, "departments", DEPARTMENT_INSERT, departments.get(shard, []))
+            inserted = self._insert(cur, "employees", PERSON_INSERT, employees.get(shard, []))
+            inserted_heads = self._insert(cur, "heads", PERSON_INSERT, heads.get(shard, []))
+            ledger.open_accounts(cur, [values[0] for values in inserted + inserted_heads])
+            cur.executemany("UPDATE Department SET head_emp_code=? WHERE dept_id=?",
+                            [(values[0], values[5]) for values in inserted_heads])
+        self.departments, self.employees, self.heads = [], [], []
+
+    def _by_shard(self, rows, dept_index):
+        if len(self.cursors) == 1:
+            return {next(iter(self.cursors)): rows}
+        grouped = {}
+        for number, values in rows:
+            grouped.setdefault(shard_for_dept(values[dept_index]), []).append((number, values))
+        return grouped
+
+    def _insert(self, cur, counter, sql, rows):
+        # rows: (line_number, values) pairs; returns the values inserted.
+        if not rows:
+            return []
+        try:
+            cur.execute("SAVEPOINT import_batch")
+            cur.executemany(sql, [values for _, values in rows])
+            cur.execute("RELEASE import_batch")
+            self.summary[counter] += len(rows)
+            return [values for _, values in rows]
+        except sqlite3.IntegrityError:
+            cur.execute("ROLLBACK TO import_batch")
+            cur.execute("RELEASE import_batch")
+        # Something slipped past validation; retry row by row to report it.
+        inserted = []
+        for number, values in rows:
+            try:
+                cur.execute(sql, values)
+                inserted.append(values)
+            except sqlite3.IntegrityError as e:
+                self.summary["errors"].append((number, f"Error in importing record: {e}"))
+        self.summary[counter] += len(inserted)
+        return inserted
+
+
+@profiling.timed
+def import_file(path, hr_name):
+    if not os.path.exists(path):
+        return Result(False, f"File not found: {path}")
+    try:
+        # Every shard's transaction stays open until the whole file has been
+        # read, so a read error rolls all of them back.
+        with ExitStack() as stack:
+            importer = _Importer({shard: stack.enter_context(transaction(shard=shard)) for shard in shard_names()},
+                                 hr_name)
+            for number, row in read_records(path):
+                importer.add(number, row)
+            importer.flush()
+    except (ValueError, csv.Error) as e:
+        return Result(False, f"Could not read {path}: {e}")
+    finally:
+        invalidate_metadata()
+    summary = importer.summary
+    message = (f"Imported {summary['departments']} departments, {summary['employees']} employees and "
+               f"{summary['heads']} heads; {len(summary['errors'])} rows rejected.")
+    return Result(True, message, summary)
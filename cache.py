@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+# Seconds an entry is served before it is read again; bounds how stale data
+# written by another process can get.
+TTL = float(os.environ.get("LEAVE_MGMT_CACHE_TTL", "60"))
+
+
+class ReadThroughCache:
+    # Values are loaded with loader(key) on a miss and kept for `ttl` seconds.
+    # Writers call invalidate() once their transaction has committed; a load
+    # that overlapped an invalidation is returned but not stored, so it can't
+    # put back what the writer just replaced.
+    def __init__(self, loader, ttl=None):
+        self.loader = loader
+        self.ttl = TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        value = self.loader(key)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def invalidate(self, *keys):
+        # Drops the given keys, or everything when called without any.
+        with self._lock:
+            self._generation += 1
+            if keys:
+                for key in keys:
+                    self._entries.pop(key, None)
+            else:
+                self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,328 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import profiling
+
+DB_PATH = os.environ.get("LEAVE_MGMT_DB", "leave_mgmt.db")
+POOL_SIZE = int(os.environ.get("LEAVE_MGMT_POOL_SIZE", "8"))
+# Closed leaves past the archive horizon live here (see archive.py); the
+# default is next to the main database, e.g. leave_mgmt-archive.db.
+ARCHIVE_PATH = os.environ.get("LEAVE_MGMT_ARCHIVE_DB")
+# Optional JSON shard map, e.g.
+#   {"north": {"path": "north.db", "departments": ["D001", "D002"]},
+#    "rest":  {"path": "rest.db", "departments": "*"}}
+# Each shard is a full database with its own archive ("archive" overrides the
+# default path). Departments not listed go to the "*" shard, else the first.
+# Leave IDs are global: the n-th shard (from 0) numbers its leaves from
+# n * LEAVE_ID_BLOCK unless "first_leave_id" says otherwise, so a leave ID
+# alone finds its shard. Without a map everything lives in DB_PATH as the
+# single shard "main".
+SHARDS_FILE = os.environ.get("LEAVE_MGMT_SHARDS")
+DEFAULT_SHARD = "main"
+FANOUT_WORKERS = int(os.environ.get("LEAVE_MGMT_FANOUT_WORKERS", "8"))
+LEAVE_ID_BLOCK = 10 ** 12
+BUSY_TIMEOUT = 30.0
+
+# Negative cache_size is in KiB, so this is a 64 MiB page cache per connection.
+CACHE_SIZE = -65536
+MMAP_SIZE = 256 * 1024 * 1024
+
+Shard = namedtuple("Shard", "path archive first_leave_id")
+Router = namedtuple("Router", "shards departments default")
+
+_router = None
+_pools = {}
+_pool_lock = threading.Lock()
+_executor = None
+_local = threading.local()
+
+
+def connect_db(path=None, archive=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None,
+                           check_same_thread=False, factory=profiling.connection_factory())
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size={CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _attach_archive(conn, archive or ARCHIVE_PATH or archive_path(path or DB_PATH))
+    return conn
+
+
+def archive_path(path):
+    return path if path == ":memory:" else os.path.splitext(path)[0] + "-archive.db"
+
+
+LEAVE_COLUMNS = "leave_id, emp_code, from_date, to_date, days, reason, leave_type, status, is_lop, is_long_leave"
+
+
+def _attach_archive(conn, path):
+    # Every connection sees main.Leave and archive.Leave together through the
+    # temp view AllLeaves; views in main can't reach an attached database. A
+    # leave left in both tiers by an interrupted archive run shows once.
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    conn.execute("PRAGMA archive.journal_mode=WAL")
+    conn.execute("PRAGMA archive.synchronous=NORMAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS archive.Leave (
+        leave_id INTEGER PRIMARY KEY,
+        emp_code TEXT,
+        from_date TEXT,
+        to_date TEXT,
+        days INTEGER,
+        reason TEXT,
+        leave_type TEXT,
+        status TEXT,
+        is_lop BOOLEAN,
+        is_long_leave BOOLEAN
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_emp ON Leave(emp_code, from_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_status_from ON Leave(status, from_date)")
+    # Overlap checks on new applications.
+    conn.execute("""CREATE INDEX IF NOT EXISTS archive.idx_archive_approved_emp_from
+                    ON Leave(emp_code, from_date, to_date) WHERE status='approved'""")
+    conn.execute(f'''CREATE TEMP VIEW IF NOT EXISTS AllLeaves AS
+                     SELECT {LEAVE_COLUMNS} FROM main.Leave
+                     UNION ALL
+                     SELECT {LEAVE_COLUMNS} FROM archive.Leave A
+                     WHERE NOT EXISTS (SELECT 1 FROM main.Leave M WHERE M.leave_id = A.leave_id)''')
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, archive=None):
+        self.path = path
+        self.archive = archive
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout=BUSY_TIMEOUT):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed.")
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return connect_db(self.path, self.archive)
+                except sqlite3.Error:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled connection.")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _load_router():
+    if not SHARDS_FILE:
+        return Router({DEFAULT_SHARD: Shard(DB_PATH, ARCHIVE_PATH or archive_path(DB_PATH), 0)}, {}, DEFAULT_SHARD)
+    with open(SHARDS_FILE, encoding="utf-8") as f:
+        spec = json.load(f)
+    if not spec:
+        raise ValueError(f"{SHARDS_FILE} defines no shards.")
+    shards, departments, default = {}, {}, None
+    for position, (name, entry) in enumerate(spec.items()):
+        shards[name] = Shard(entry["path"], entry.get("archive") or archive_path(entry["path"]),
+                             int(entry.get("first_leave_id", position * LEAVE_ID_BLOCK)))
+        listed = entry.get("departments", [])
+        if listed == "*":
+            default = name
+            continue
+        for dept_id in listed:
+            if departments.setdefault(dept_id, name) != name:
+                raise ValueError(f"Department {dept_id} is mapped to more than one shard.")
+    return Router(shards, departments, default or next(iter(shards)))
+
+
+def router():
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = _load_router()
+    return _router
+
+
+def shard_names():
+    return list(router().shards)
+
+
+def is_sharded():
+    return len(router().shards) > 1
+
+
+def default_shard():
+    return router().default
+
+
+def shard_for_dept(dept_id):
+    current = router()
+    return current.departments.get(dept_id, current.default)
+
+
+def shard_for_leave(leave_id):
+    # The shard with the highest first_leave_id at or below leave_id.
+    found = None
+    for name, shard in router().shards.items():
+        if shard.first_leave_id <= leave_id and (found is None or shard.first_leave_id > found[1]):
+            found = (name, shard.first_leave_id)
+    return found[0] if found else default_shard()
+
+
+def first_leave_id(shard=None):
+    return router().shards[shard or current_shard()].first_leave_id
+
+
+def current_shard():
+    return getattr(_local, "shard", None) or router().default
+
+
+@contextmanager
+def use_shard(name):
+    # Connections opened by this thread inside the block go to `name`.
+    if name not in router().shards:
+        raise ValueError(f"Unknown shard: {name}")
+    previous = getattr(_local, "shard", None)
+    _local.shard = name
+    try:
+        yield
+    finally:
+        _local.shard = previous
+
+
+def get_pool(shard=None):
+    name = shard or current_shard()
+    pool = _pools.get(name)
+    if pool is None:
+        current = router()
+        with _pool_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                if name not in current.shards:
+                    raise ValueError(f"Unknown shard: {name}")
+                shard = current.shards[name]
+                pool = _pools[name] = ConnectionPool(shard.path, POOL_SIZE, shard.archive)
+    return pool
+
+
+def configure(path=None, size=None, shards_file=None):
+    # path switches to single-database mode; shards_file to a shard map.
+    global DB_PATH, POOL_SIZE, SHARDS_FILE, _router
+    with _pool_lock:
+        if path is not None:
+            DB_PATH = path
+            SHARDS_FILE = None
+        if shards_file is not None:
+            SHARDS_FILE = shards_file
+        if size is not None:
+            POOL_SIZE = size
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        _router = None
+
+
+def close_pool():
+    configure()
+
+
+def fan_out(func, *args, **kwargs):
+    # Calls func once per shard, inside use_shard, and returns {shard: result}
+    # in shard-map order. Shards run in parallel on a shared thread pool;
+    # a fan-out started from one of its workers runs serially instead of
+    # waiting on workers that may all be busy with its parent.
+    names = shard_names()
+
+    def run(name):
+        with use_shard(name):
+            return func(*args, **kwargs)
+
+    if len(names) == 1 or getattr(_local, "fanning_out", False):
+        return {name: run(name) for name in names}
+    return dict(zip(names, _fan_out_executor().map(run, names)))
+
+
+def _fan_out_executor():
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(FANOUT_WORKERS, thread_name_prefix="shard",
+                                               initializer=_mark_fan_out_worker)
+    return _executor
+
+
+def _mark_fan_out_worker():
+    _local.fanning_out = True
+
+
+@contextmanager
+def connection(shard=None):
+    # A thread that already holds a pooled connection to the shard keeps using
+    # it, so helpers called inside a transaction see that transaction's writes.
+    name = shard or current_shard()
+    held = _local.__dict__.setdefault("conns", {})
+    conn = held.get(name)
+    if conn is not None:
+        yield conn
+        return
+    pool = get_pool(name)
+    conn = pool.acquire()
+    held[name] = conn
+    try:
+        yield conn
+    finally:
+        del held[name]
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(immediate=True, shard=None):
+    # Writers take the write lock up front; a deferred BEGIN that reads and then
+    # writes fails with SQLITE_BUSY instead of waiting when another writer commits.
+    with connection(shard) as conn:
+        if conn.in_transaction:
+            conn.execute("SAVEPOINT nested")
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK TO nested")
+                conn.execute("RELEASE nested")
+                raise
+            conn.execute("RELEASE nested")
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
@@ -0,0 +1,162 @@
+import json
+
+import profiling
+from db import fan_out, shard_for_leave, transaction
+
+# Leave columns carried by 'opening' and 'applied' events, in Leave order.
+LEAVE_FIELDS = ("emp_code", "from_date", "to_date", "days", "reason", "leave_type", "status", "is_lop",
+                "is_long_leave")
+STATUS_EVENTS = {"approved", "rejected", "cancelled"}
+_STATUS = LEAVE_FIELDS.index("status")
+_FLAGS = (LEAVE_FIELDS.index("is_lop"), LEAVE_FIELDS.index("is_long_leave"))
+# Older checkpoints are dropped; point-in-time queries before the oldest one
+# replay from the start of the log instead.
+KEEP_CHECKPOINTS = 30
+
+
+def record(cur, rows):
+    # rows: (leave_id, emp_code, event, actor, data dict or None), written with
+    # one executemany in the caller's transaction.
+    cur.executemany("INSERT INTO LeaveEvent (leave_id, emp_code, event, actor, data) VALUES (?, ?, ?, ?, ?)",
+                    [(leave_id, emp_code, event, actor, None if data is None else json.dumps(data))
+                     for leave_id, emp_code, event, actor, data in rows])
+
+
+def open_leaves(cur):
+    # An 'opening' event with the current state for every leave that has no
+    # history yet, e.g. rows that predate the log or were bulk loaded.
+    cur.execute(f'''INSERT INTO LeaveEvent (leave_id, emp_code, event, data)
+                    SELECT leave_id, emp_code, 'opening',
+                           json_object({", ".join(f"'{field}', {field}" for field in LEAVE_FIELDS[1:])})
+                    FROM Leave L
+                    WHERE NOT EXISTS (SELECT 1 FROM LeaveEvent E WHERE E.leave_id = L.leave_id)
+                    ORDER BY leave_id''')
+
+
+def history(leave_id):
+    with transaction(immediate=False, shard=shard_for_leave(leave_id)) as cur:
+        return cur.execute('''SELECT event_id, event, actor, data, created_at FROM LeaveEvent
+                              WHERE leave_id=? ORDER BY event_id''', (leave_id,)).fetchall()
+
+
+def _bounds(cur, at=None):
+    # Last event and ledger entry at or before `at` (UTC 'YYYY-MM-DD HH:MM:SS').
+    if at is None:
+        return (cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM LeaveEvent").fetchone()[0],
+                cur.execute("SELECT COALESCE(MAX(entry_id), 0) FROM BalanceLedger").fetchone()[0])
+    return (cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM LeaveEvent WHERE created_at <= ?",
+                        (at,)).fetchone()[0],
+            cur.execute("SELECT COALESCE(MAX(entry_id), 0) FROM BalanceLedger WHERE created_at <= ?",
+                        (at,)).fetchone()[0])
+
+
+def _normalized(fields):
+    # Flags are stored as Python bools or 0/1 depending on the writer.
+    for index in _FLAGS:
+        fields[index] = int(bool(fields[index]))
+    return fields
+
+
+def _replay(cur, event_bound, entry_bound, emp_code=None):
+    # Latest checkpoint inside the bounds, then one ordered pass over the
+    # events and ledger entries after it. Returns ({leave_id: [fields]},
+    # {emp_code: balance}).
+    leaves = {}
+    balances = {}
+    checkpoint = cur.execute('''SELECT checkpoint_id, event_id, entry_id FROM EventCheckpoint
+                                WHERE event_id <= ? AND entry_id <= ?
+                                ORDER BY checkpoint_id DESC LIMIT 1''', (event_bound, entry_bound)).fetchone()
+    where, params = ("", ()) if emp_code is None else (" AND emp_code=?", (emp_code,))
+    start_event = start_entry = 0
+    if checkpoint:
+        checkpoint_id, start_event, start_entry = checkpoint
+        for row in cur.execute(f"SELECT leave_id, {', '.join(LEAVE_FIELDS)} FROM CheckpointLeave "
+                               f"WHERE checkpoint_id=?{where}", (checkpoint_id, *params)):
+            leaves[row[0]] = list(row[1:])
+        balances.update(cur.execute(f"SELECT emp_code, balance FROM CheckpointBalance WHERE checkpoint_id=?{where}",
+                                    (checkpoint_id, *params)))
+
+    for leave_id, emp, event, data in cur.execute(
+            f'''SELECT leave_id, emp_code, event, data FROM LeaveEvent
+                WHERE event_id > ? AND event_id <= ?{where} ORDER BY event_id''',
+            (start_event, event_bound, *params)):
+        if event in ("opening", "applied"):
+            fields = {"status": "pending", **json.loads(data), "emp_code": emp}
+            leaves[leave_id] = _normalized([fields[name] for name in LEAVE_FIELDS])
+        elif event == "deleted":
+            # Written by hard deletes before people were relieved instead.
+            leaves.pop(leave_id, None)
+        elif event in STATUS_EVENTS and leave_id in leaves:
+            leaves[leave_id][_STATUS] = event
+            if data and json.loads(data).get("is_lop"):
+                leaves[leave_id][_FLAGS[0]] = 1
+
+    for emp, delta in cur.execute(f'''SELECT emp_code, delta FROM BalanceLedger
+                                      WHERE entry_id > ? AND entry_id <= ?{where} ORDER BY entry_id''',
+                                  (start_entry, entry_bound, *params)):
+        balances[emp] = balances.get(emp, 0) + delta
+    return leaves, balances
+
+
+def _shard_state(at, emp_code):
+    with transaction(immediate=False) as cur:
+        return _replay(cur, *_bounds(cur, at), emp_code)
+
+
+def state_at(at=None, emp_code=None):
+    # Leave and balance state rebuilt from the log as of `at` (default: now),
+    # optionally for one person only. Each shard replays its own log; leave
+    # IDs and people don't repeat across shards.
+    leaves, balances = {}, {}
+    for shard_leaves, shard_balances in fan_out(_shard_state, at, emp_code).values():
+        leaves.update(shard_leaves)
+        balances.update(shard_balances)
+    return leaves, balances
+
+
+@profiling.timed
+def checkpoint():
+    # Replays from the previous checkpoint in a read transaction, so writers
+    # aren't blocked, then stores the result tagged with the bounds it covers.
+    # Returns None when nothing was logged since the last checkpoint.
+    with transaction(immediate=False) as cur:
+        event_bound, entry_bound = _bounds(cur)
+        leaves, balances = _replay(cur, event_bound, entry_bound)
+    with transaction() as cur:
+        last = cur.execute("SELECT MAX(event_id), MAX(entry_id) FROM EventCheckpoint").fetchone()
+        if last[0] is not None and (last[0] >= event_bound and last[1] >= entry_bound):
+            return None
+        cur.execute("INSERT INTO EventCheckpoint (event_id, entry_id) VALUES (?, ?)", (event_bound, entry_bound))
+        checkpoint_id = cur.lastrowid
+        cur.executemany(f'''INSERT INTO CheckpointLeave (checkpoint_id, leave_id, {', '.join(LEAVE_FIELDS)})
+                            VALUES ({', '.join('?' * (len(LEAVE_FIELDS) + 2))})''',
+                        ((checkpoint_id, leave_id, *fields) for leave_id, fields in leaves.items()))
+        cur.executemany("INSERT INTO CheckpointBalance (checkpoint_id, emp_code, balance) VALUES (?, ?, ?)",
+                        ((checkpoint_id, emp, balance) for emp, balance in balances.items()))
+        stale = [row[0] for row in cur.execute(
+            "SELECT checkpoint_id FROM EventCheckpoint ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (KEEP_CHECKPOINTS,))]
+        for table in ("CheckpointLeave", "CheckpointBalance", "EventCheckpoint"):
+            cur.executemany(f"DELETE FROM {table} WHERE checkpoint_id=?", [(old,) for old in stale])
+    return {"checkpoint_id": checkpoint_id, "event_id": event_bound, "entry_id": entry_bound,
+            "leaves": len(leaves), "balances": len(balances)}
+
+
+def mismatches():
+    # Leaves and balances whose live row disagrees with the replayed log, in
+    # every shard.
+    return [found for shard_found in fan_out(_shard_mismatches).values() for found in shard_found]
+
+
+def _shard_mismatches():
+    with transaction(immediate=False) as cur:
+        leaves, balances = _replay(cur, *_bounds(cur))
+        found = []
+        for row in cur.execute(f"SELECT leave_id, {', '.join(LEAVE_FIELDS)} FROM AllLeaves ORDER BY leave_id"):
+            if leaves.pop(row[0], None) != _normalized(list(row[1:])):
+                found.append(("leave", row[0]))
+        found.extend(("leave", leave_id) for leave_id in sorted(leaves))
+        for emp, amount in cur.execute("SELECT emp_code, leave_balance FROM Person ORDER BY emp_code"):
+            if balances.get(emp, 0) != amount:
+                found.append(("balance", emp))
+    return found
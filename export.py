@@ -0,0 +1,142 @@
+import csv
+import heapq
+import json
+
+import profiling
+from db import router, shard_for_dept, transaction
+from leave_service import Result
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FETCH_SIZE = 5000
+
+EXPORT_COLUMNS = ["leave_id", "emp_code", "name", "dept_id", "department", "from_date", "to_date", "days",
+                  "leave_type", "status", "is_lop", "is_long_leave"]
+
+
+def _export_query(table, dept_id=None, status=None, from_date=None, to_date=None, lop_only=False):
+    # One tier at a time, so SQLite walks it in rowid order rather than
+    # sorting the whole AllLeaves union in a temp B-tree.
+    where = []
+    params = []
+    if dept_id:
+        where.append("E.dept_id=?")
+        params.append(dept_id)
+    if status:
+        where.append("L.status=?")
+        params.append(status)
+    if from_date:
+        where.append("L.to_date >= ?")
+        params.append(from_date)
+    if to_date:
+        where.append("L.from_date <= ?")
+        params.append(to_date)
+    if lop_only:
+        where.append("L.is_lop")
+    sql = f'''SELECT L.leave_id, L.emp_code, E.name, E.dept_id, E.department, L.from_date, L.to_date, L.days,
+                    L.leave_type, L.status, L.is_lop, L.is_long_leave
+             FROM {table} L NOT INDEXED JOIN Person E ON L.emp_code = E.emp_code'''
+    if table == "archive.Leave":
+        # A row mid-move is still in main.Leave; AllLeaves shows that copy.
+        where.append("NOT EXISTS (SELECT 1 FROM main.Leave M WHERE M.leave_id = L.leave_id)")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY L.leave_id", params
+
+
+def _fetch(cur, fetch_size):
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _export_shards(dept_id=None, **_):
+    # Shards own disjoint leave_id ranges, so reading them one after another
+    # in first_leave_id order keeps the export in leave_id order.
+    if dept_id:
+        return [shard_for_dept(dept_id)]
+    shards = router().shards
+    return sorted(shards, key=lambda name: shards[name].first_leave_id)
+
+
+def iter_batches(fetch_size=FETCH_SIZE, **filters):
+    # One read snapshot per shard; the hot and archive tiers are streamed
+    # side by side and merged on leave_id, fetch_size rows at a time.
+    for shard in _export_shards(**filters):
+        with transaction(immediate=False, shard=shard) as cur:
+            tiers = []
+            for table in ("main.Leave", "archive.Leave"):
+                sql, params = _export_query(table, **filters)
+                tier = cur.connection.cursor()
+                tier.execute(sql, params)
+                tiers.append(_fetch(tier, fetch_size))
+            batch = []
+            for row in heapq.merge(*tiers, key=lambda row: row[0]):
+                batch.append(row)
+                if len(batch) == fetch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+
+def _write_csv(path, batches):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _write_jsonl(path, batches):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for rows in batches:
+            f.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+
+PARQUET_SCHEMA = None if pyarrow is None else pyarrow.schema([
+    ("leave_id", pyarrow.int64()), ("emp_code", pyarrow.string()), ("name", pyarrow.string()),
+    ("dept_id", pyarrow.string()), ("department", pyarrow.string()), ("from_date", pyarrow.string()),
+    ("to_date", pyarrow.string()), ("days", pyarrow.int32()), ("leave_type", pyarrow.string()),
+    ("status", pyarrow.string()), ("is_lop", pyarrow.bool_()), ("is_long_leave", pyarrow.bool_()),
+])
+
+
+def _write_parquet(path, batches):
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, PARQUET_SCHEMA, compression="zstd") as writer:
+        for rows in batches:
+            arrays = []
+            for column, field in zip(zip(*rows), PARQUET_SCHEMA):
+                if field.type == pyarrow.bool_():
+                    column = [None if value is None else bool(value) for value in column]
+                arrays.append(pyarrow.array(column, type=field.type))
+            # One row group per fetched batch keeps memory bounded.
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=PARQUET_SCHEMA))
+            count += len(rows)
+    return count
+
+
+WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+@profiling.timed
+def export_leaves(path, fmt="csv", fetch_size=FETCH_SIZE, **filters):
+    if fmt not in WRITERS:
+        return Result(False, f"Unknown export format: {fmt}")
+    if fmt == "parquet" and pyarrow is None:
+        return Result(False, "Parquet export needs the pyarrow package.")
+    count = WRITERS[fmt](path, iter_batches(fetch_size, **filters))
+    return Result(True, f"Exported {count} leave records to {path}.", {"rows": count})
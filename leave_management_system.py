@@ -1,97 +1,31 @@
-import sqlite3
-import datetime
+import argparse
+import json
 import re
-
-def connect_db():
-    return sqlite3.connect("leave_mgmt.db")
-
-def create_tables():
-    conn = connect_db()
-    cur = conn.cursor()
-
-    cur.execute('''CREATE TABLE IF NOT EXISTS HR (
-        hr_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        designation TEXT NOT NULL,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )''')
-
-    cur.execute('''CREATE TABLE IF NOT EXISTS Department (
-        dept_id TEXT PRIMARY KEY,
-        dept_name TEXT NOT NULL,
-        head_emp_code TEXT
-    )''')
-
-    cur.execute('''CREATE TABLE IF NOT EXISTS Head (
-        emp_code TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        department TEXT NOT NULL,
-        designation TEXT NOT NULL,
-        post TEXT NOT NULL,
-        dept_id TEXT NOT NULL,
-        join_date TEXT NOT NULL,
-        relieve_date TEXT,
-        leave_balance INTEGER NOT NULL,
-        live_status TEXT DEFAULT 'live',
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        created_by_hr TEXT NOT NULL,
-        FOREIGN KEY (dept_id) REFERENCES Department(dept_id)
-    )''')
-
-    cur.execute('''CREATE TABLE IF NOT EXISTS Employee (
-        emp_code TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        department TEXT NOT NULL,
-        designation TEXT NOT NULL,
-        post TEXT NOT NULL,
-        dept_id TEXT NOT NULL,
-        join_date TEXT NOT NULL,
-        relieve_date TEXT,
-        leave_balance INTEGER NOT NULL,
-        live_status TEXT DEFAULT 'live',
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        created_by_hr TEXT NOT NULL,
-        FOREIGN KEY (dept_id) REFERENCES Department(dept_id)
-    )''')
-
-    cur.execute('''CREATE TABLE IF NOT EXISTS Leave (
-        leave_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        emp_code TEXT,
-        from_date TEXT,
-        to_date TEXT,
-        days INTEGER,
-        reason TEXT,
-        leave_type TEXT,
-        status TEXT CHECK(status IN ('pending','approved','rejected','cancelled')) DEFAULT 'pending',
-        is_lop BOOLEAN,
-        is_long_leave BOOLEAN,
-        FOREIGN KEY (emp_code) REFERENCES Employee(emp_code)
-    )''')
-
-    conn.commit()
-    conn.close()
-
-def valid_name(name):
-    return bool(re.fullmatch(r"[A-Za-z\s\.\'-]+", name))
+import sys
+from contextlib import nullcontext
+
+import accrual
+import analytics
+import archive
+import bulk_import
+import db
+import events
+import export
+import leave_service as service
+import lifecycle
+import profiling
+import server
+import submissions
+from leave_service import valid_name
+from schema import create_tables
 
 def register_hr():
-    conn = connect_db()
-    cur = conn.cursor()
-    
     while True:
         hr_id = input("Enter 6-digit HR ID (must start with 'HR' followed by 4 digits, e.g., HR1234): ")
-        if not re.fullmatch(r'^HR\d{4}$', hr_id):
-            print("Invalid HR ID format. Must start with 'HR' followed by 4 digits.")
-            continue
-            
-        cur.execute("SELECT 1 FROM Employee WHERE emp_code=? UNION SELECT 1 FROM Head WHERE emp_code=?", (hr_id, hr_id))
-        if cur.fetchone():
-            print("This ID is already used as an employee code. Please choose a different HR ID.")
+        checked = service.check_hr_id(hr_id)
+        if not checked.ok:
+            print(checked.message)
             continue
-            
         break
 
     name = input("Enter HR Name: ")
@@ -102,79 +36,43 @@ def register_hr():
     designation = input("Enter Designation: ")
     username = input("Create Username: ")
     password = input("Create Password: ")
-
-    try:
-        cur.execute("INSERT INTO HR VALUES (?, ?, ?, ?, ?)", (hr_id, name, designation, username, password))
-        conn.commit()
-        print("HR Registered Successfully.")
-    except sqlite3.IntegrityError:
-        print("HR ID or Username already exists.")
-    conn.close()
+    print(service.register_hr(hr_id, name, designation, username, password).message)
 
 def login_hr():
-    conn = connect_db()
-    cur = conn.cursor()
     username = input("Username: ")
     password = input("Password: ")
-    cur.execute("SELECT * FROM HR WHERE username=?", (username,))
-    hr = cur.fetchone()
-    conn.close()
-    if hr and hr[4] == password:
-        return hr
-    print("Not a Registered HR. Please Register.")
+    result = service.login_hr(username, password)
+    if result.ok:
+        return result.data
+    print(result.message)
     return None
 
 def create_department():
-    conn = connect_db()
-    cur = conn.cursor()
     dept_id = input("Enter 4-char Department ID: ")
     if len(dept_id) != 4:
         print("Department ID must be 4 characters.")
         return
     dept_name = input("Department Name: ")
-    try:
-        cur.execute("INSERT INTO Department VALUES (?, ?, NULL)", (dept_id, dept_name))
-        conn.commit()
-        print("Department Created.")
-    except sqlite3.IntegrityError:
-        print("Department ID already exists.")
-    conn.close()
+    print(service.create_department(dept_id, dept_name).message)
 
 def create_employee(hr_name):
-    conn = connect_db()
-    cur = conn.cursor()
-
     while True:
         emp_code = input("Enter Unique Employee Code (must be 6 digits): ")
-        if not emp_code.isdigit() or len(emp_code) != 6:
-            print("Employee Code must be 6 digits.")
-            continue
-            
-        cur.execute("SELECT 1 FROM HR WHERE hr_id=?", (emp_code,))
-        if cur.fetchone():
-            print("This code is already used as an HR ID. Please choose a different employee code.")
-            continue
-            
-        cur.execute("SELECT 1 FROM Employee WHERE emp_code=? UNION SELECT 1 FROM Head WHERE emp_code=?", (emp_code, emp_code))
-        if cur.fetchone():
-            print("Employee code already exists.")
+        checked = service.check_emp_code(emp_code)
+        if not checked.ok:
+            print(checked.message)
             continue
-            
         break
 
     name = input("Enter Employee Name: ")
     if not valid_name(name):
         print("Invalid name.")
-        conn.close()
         return
 
     department = input("Department Name: ")
     dept_id = input("Enter Department ID: ")
-    cur.execute("SELECT * FROM Department WHERE dept_id=?", (dept_id,))
-    dept = cur.fetchone()
-    if not dept:
+    if not service.get_department(dept_id):
         print("Department not created. Please create department first.")
-        conn.close()
         return
 
     designation = input("Designation: ")
@@ -182,145 +80,52 @@ def create_employee(hr_name):
     join_date = input("Join Date (YYYY-MM-DD): ")
 
     try:
-        join_dt = datetime.datetime.strptime(join_date, "%Y-%m-%d").date()
+        service.parse_date(join_date)
     except ValueError:
         print("Invalid date format.")
-        conn.close()
         return
 
-    experience_days = (datetime.date.today() - join_dt).days
-    leave_balance = 36 if experience_days >= 365 else 12
-
-    username = emp_code
     password = input("Create Password for Employee: ")
     is_head = input("Is this employee a department head? (yes/no): ").strip().lower() == "yes"
-
-    try:
-        if is_head:
-            cur.execute("INSERT INTO Head VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, 'live', ?, ?, ?)", 
-                        (emp_code, name, department, designation, post, dept_id, join_date, leave_balance,
-                         username, password, hr_name))
-            cur.execute("UPDATE Department SET head_emp_code=? WHERE dept_id=?", (emp_code, dept_id))
-        else:
-            cur.execute("INSERT INTO Employee VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, 'live', ?, ?, ?)", 
-                        (emp_code, name, department, designation, post, dept_id, join_date, leave_balance,
-                         username, password, hr_name))
-        conn.commit()
-        print("Employee Added.")
-    except sqlite3.IntegrityError as e:
-        print(f"Error in creating employee: {e}")
-    conn.close()
+    print(service.create_employee(hr_name, emp_code, name, department, dept_id, designation, post, join_date,
+                                  password, is_head).message)
 
 def login_employee():
-    conn = connect_db()
-    cur = conn.cursor()
     username = input("Username (Emp Code): ")
     password = input("Password: ")
-    cur.execute("SELECT * FROM Employee WHERE username=?", (username,))
-    emp = cur.fetchone()
-    conn.close()
-    if emp and emp[11] == password:
-        return emp
-    print("Login Failed.")
+    result = service.login_employee(username, password)
+    if result.ok:
+        return result.data
+    print(result.message)
     return None
 
 def login_head():
-    conn = connect_db()
-    cur = conn.cursor()
     username = input("Head Username (Emp Code): ")
     password = input("Password: ")
-    cur.execute("SELECT * FROM Head WHERE username=?", (username,))
-    head = cur.fetchone()
-    conn.close()
-    if head and head[11] == password:
-        return head
-    print("Login Failed.")
+    result = service.login_head(username, password)
+    if result.ok:
+        return result.data
+    print(result.message)
     return None
 
 def apply_leave(emp_code):
-    conn = connect_db()
-    cur = conn.cursor()
-    
-    # Get employee details
-    cur.execute("SELECT join_date, leave_balance FROM Employee WHERE emp_code=?", (emp_code,))
-    emp_data = cur.fetchone()
-    if not emp_data:
+    if not service.employee_profile(emp_code):
         print("Employee not found.")
-        conn.close()
         return
-        
-    join_date, balance = emp_data
-    join_dt = datetime.datetime.strptime(join_date, "%Y-%m-%d").date()
-    experience_days = (datetime.date.today() - join_dt).days
-    
+
     # Input leave details
     from_date = input("From Date (YYYY-MM-DD): ")
     to_date = input("To Date (YYYY-MM-DD): ")
     reason = input("Leave Reason: ")
     leave_type = input("Leave Type (Casual, Sick, Earned, Combo): ").capitalize()
-    
-    # Validate leave type for employees with <1 year experience
-    if experience_days < 365 and leave_type != 'Casual':
-        print("Employees with less than one year experience can only take Casual leave.")
-        conn.close()
-        return
-    
-    if leave_type not in ['Casual', 'Sick', 'Earned', 'Combo']:
-        print("Invalid leave type.")
-        conn.close()
-        return
 
-    try:
-        from_dt = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
-        to_dt = datetime.datetime.strptime(to_date, "%Y-%m-%d").date()
-        days = (to_dt - from_dt).days + 1
-    except ValueError:
-        print("Invalid date format.")
-        conn.close()
-        return
-
-    is_long = days > 4
-    is_lop = False
-
-    # Check leave balance and restrictions
-    if experience_days < 365:
-        current_month = datetime.date.today().month
-        cur.execute("""
-            SELECT COALESCE(SUM(days), 0) 
-            FROM Leave 
-            WHERE emp_code=? 
-            AND strftime('%m', from_date)=? 
-            AND status='approved'
-        """, (emp_code, f"{current_month:02}"))
-        approved_days_this_month = cur.fetchone()[0]
-        
-        if approved_days_this_month + days > 1:  # Only 1 casual leave allowed per month
-            extra_days = (approved_days_this_month + days) - 1
-            print(f"Warning: Only 1 casual leave allowed per month. {extra_days} days will be marked as LOP.")
-            is_lop = True
-    elif balance < days:
-        is_lop = True
-
-    # Apply the leave
-    cur.execute('''INSERT INTO Leave (emp_code, from_date, to_date, days, reason, leave_type, is_lop, is_long_leave)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                (emp_code, from_date, to_date, days, reason, leave_type, is_lop, is_long))
-
-    if is_long:
-        cur.execute("UPDATE Employee SET live_status='longleave' WHERE emp_code=?", (emp_code,))
-    conn.commit()
-    conn.close()
-    print("Leave Applied.")
+    result = service.apply_leave(emp_code, from_date, to_date, leave_type, reason)
+    if result.ok and result.data["lop_days"]:
+        print(f"Warning: Only 1 casual leave allowed per month. {result.data['lop_days']} days will be marked as LOP.")
+    print(result.message)
 
 def view_leave_status(emp_code):
-    conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT leave_id, from_date, to_date, days, reason, leave_type, status, is_lop, is_long_leave 
-        FROM Leave 
-        WHERE emp_code=?
-    """, (emp_code,))
-    leaves = cur.fetchall()
+    leaves = service.leave_history(emp_code)
     if not leaves:
         print("No leave applications found.")
     else:
@@ -331,25 +136,14 @@ def view_leave_status(emp_code):
             print("{:<8} {:<12} {:<12} {:<6} {:<10} {:<8} {:<10} {:<6} {:<10}".format(
                 l[0], l[1], l[2], l[3], l[4][:8]+"..." if len(l[4])>8 else l[4], 
                 l[5], l[6], "Yes" if l[7] else "No", "Yes" if l[8] else "No"))
-    conn.close()
 
 def cancel_leave(emp_code):
-    conn = connect_db()
-    cur = conn.cursor()
-    
     # Show only pending or approved leaves that can be cancelled
-    cur.execute("""
-        SELECT leave_id, from_date, to_date, days, reason, leave_type, status 
-        FROM Leave 
-        WHERE emp_code=? AND status IN ('pending', 'approved')
-    """, (emp_code,))
-    leaves = cur.fetchall()
-    
+    leaves = service.cancellable_leaves(emp_code)
     if not leaves:
         print("No cancellable leaves found.")
-        conn.close()
         return
-    
+
     print("\nCancellable Leaves:")
     print("{:<8} {:<12} {:<12} {:<6} {:<10} {:<8} {:<10}".format(
         "ID", "From", "To", "Days", "Reason", "Type", "Status"))
@@ -357,163 +151,167 @@ def cancel_leave(emp_code):
         print("{:<8} {:<12} {:<12} {:<6} {:<10} {:<8} {:<10}".format(
             l[0], l[1], l[2], l[3], l[4][:8]+"..." if len(l[4])>8 else l[4], 
             l[5], l[6]))
-    
+
     try:
         leave_id = int(input("\nEnter Leave ID to cancel (0 to abort): "))
     except ValueError:
         print("Invalid input. Please enter a number.")
-        conn.close()
         return
-    
+
     if leave_id == 0:
         print("Cancellation aborted.")
-        conn.close()
         return
-    
-    # Verify the leave belongs to this employee and is cancellable
-    cur.execute("""
-        SELECT status, days, is_lop 
-        FROM Leave 
-        WHERE leave_id=? AND emp_code=? AND status IN ('pending', 'approved')
-    """, (leave_id, emp_code))
-    leave_info = cur.fetchone()
-    
-    if not leave_info:
+
+    if not service.can_cancel(emp_code, leave_id):
         print("Invalid Leave ID or leave cannot be cancelled.")
-        conn.close()
         return
-    
-    status, days, is_lop = leave_info
-    
+
     confirm = input(f"Are you sure you want to cancel leave ID {leave_id}? (yes/no): ").lower()
     if confirm != 'yes':
         print("Cancellation aborted.")
-        conn.close()
         return
-    
-    try:
-        # Update leave status to cancelled
-        cur.execute("UPDATE Leave SET status='cancelled' WHERE leave_id=?", (leave_id,))
-        
-        # If leave was approved and not LOP, restore leave balance
-        if status == 'approved' and not is_lop:
-            cur.execute("""
-                UPDATE Employee 
-                SET leave_balance = leave_balance + ? 
-                WHERE emp_code=?
-            """, (days, emp_code))
-        
-        # If this was a long leave, update live status
-        cur.execute("SELECT is_long_leave FROM Leave WHERE leave_id=?", (leave_id,))
-        is_long_leave = cur.fetchone()[0]
-        if is_long_leave:
-            cur.execute("UPDATE Employee SET live_status='live' WHERE emp_code=?", (emp_code,))
-        
-        conn.commit()
-        print("Leave successfully cancelled.")
-    except sqlite3.Error as e:
-        print(f"Error cancelling leave: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+
+    print(service.cancel_leave(emp_code, leave_id).message)
+
+def print_inbox_summary(dept_id):
+    summary = service.inbox_summary(dept_id)
+    for leave_type, ages in sorted(summary["counts"].items()):
+        print(f"{leave_type}: " + ", ".join(f"{count} {age}" for age, count in ages.items()))
+    return summary["total"]
 
 def process_head_leaves(head):
-    conn = connect_db()
-    cur = conn.cursor()
     dept_id = head[5]
-    cur.execute('''SELECT L.leave_id, E.emp_code, E.name, L.from_date, L.to_date, L.days, L.reason, L.leave_type
-                   FROM Leave L JOIN Employee E ON L.emp_code = E.emp_code
-                   WHERE L.status='pending' AND E.dept_id=?''', (dept_id,))
-    rows = cur.fetchall()
-    if not rows:
+    if not print_inbox_summary(dept_id):
         print("No requests currently.")
-        conn.close()
         return
+    rows = service.pending_leaves(dept_id)
 
+    decisions = []
     for row in rows:
         leave_id, emp_code, name, from_date, to_date, days, reason, leave_type = row
         print(f"\nLeave ID: {leave_id}, Emp Code: {emp_code}, Name: {name}, From: {from_date}, To: {to_date}, Days: {days}, Type: {leave_type}, Reason: {reason}")
         choice = input("Approve (a) or Reject (r): ").lower()
-        if choice == 'a':
-            cur.execute("UPDATE Leave SET status='approved' WHERE leave_id=?", (leave_id,))
-            cur.execute("UPDATE Employee SET leave_balance = leave_balance - ? WHERE emp_code=? AND leave_balance >= ?", (days, emp_code, days))
-        else:
-            cur.execute("UPDATE Leave SET status='rejected' WHERE leave_id=?", (leave_id,))
-    conn.commit()
-    conn.close()
+        decisions.append((leave_id, choice == 'a'))
+    result = service.decide_leaves(dept_id, decisions, head[0])
+    print(result.message)
 
-def view_all_leaves_hr():
-    conn = connect_db()
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT L.leave_id, L.emp_code, E.name, E.department, 
-               L.from_date, L.to_date, L.days, L.leave_type, L.status,
-               L.is_lop, L.is_long_leave,
-               CASE WHEN julianday(E.join_date) > julianday('now','-1 year') 
-                    THEN 'New' ELSE 'Experienced' END as experience
-        FROM Leave L JOIN Employee E ON L.emp_code = E.emp_code
-        ORDER BY L.status, L.from_date DESC
-    ''')
-    leaves = cur.fetchall()
-    if not leaves:
-        print("No leave records found.")
+def _parse_ids(text):
+    return [int(part) for part in text.replace(",", " ").split()]
+
+def bulk_process_head_leaves(head):
+    dept_id = head[5]
+    rows = service.pending_leaves(dept_id)
+    if not rows:
+        print("No requests currently.")
+        return
+
+    print("\nPending Leave Requests:")
+    print("{:<8} {:<10} {:<15} {:<12} {:<12} {:<6} {:<8}".format(
+        "ID", "Emp Code", "Name", "From", "To", "Days", "Type"))
+    for l in rows:
+        print("{:<8} {:<10} {:<15} {:<12} {:<12} {:<6} {:<8}".format(
+            l[0], l[1], l[2][:12]+"..." if len(l[2])>12 else l[2], l[3], l[4], l[5], l[7]))
+
+    print("1. Approve/Reject selected Leave IDs")
+    print("2. Approve all 1-day Casual leaves with enough balance")
+    mode = input("Choose option (1-2): ")
+    if mode == '1':
+        try:
+            approve_ids = _parse_ids(input("Leave IDs to approve (comma separated): "))
+            reject_ids = _parse_ids(input("Leave IDs to reject (comma separated): "))
+        except ValueError:
+            print("Invalid input. Please enter numbers.")
+            return
+        result = service.decide_leaves(dept_id, [(i, True) for i in approve_ids] + [(i, False) for i in reject_ids],
+                                       head[0])
+    elif mode == '2':
+        result = service.auto_approve(dept_id, 'Casual', 1, actor=head[0])
     else:
-        print("\nAll Leave Records:")
-        print("{:<8} {:<10} {:<15} {:<15} {:<12} {:<12} {:<6} {:<8} {:<10} {:<6} {:<10} {:<12}".format(
-            "ID", "Emp Code", "Name", "Department", "From", "To", "Days", "Type", "Status", "LOP", "Long Leave", "Experience"))
-        for l in leaves:
+        print("Invalid choice.")
+        return
+    print(result.message)
+
+HR_PAGE_SIZE = 20
+
+def view_all_leaves_hr():
+    filters = {
+        "dept_id": input("Filter by Department ID (leave blank for all): ").strip(),
+        "status": input("Filter by Status (pending/approved/rejected/cancelled, blank for all): ").strip().lower(),
+        "emp_code": input("Filter by Employee Code (leave blank for all): ").strip(),
+        "from_date": input("Leaves on or after (YYYY-MM-DD, blank for any): ").strip(),
+        "to_date": input("Leaves on or before (YYYY-MM-DD, blank for any): ").strip(),
+    }
+    if filters["status"] and filters["status"] not in service.LEAVE_STATUSES:
+        print("Invalid status.")
+        return
+
+    shown = 0
+    for l in service.iter_leaves(batch_size=HR_PAGE_SIZE, **filters):
+        if shown == 0:
+            print("\nAll Leave Records:")
             print("{:<8} {:<10} {:<15} {:<15} {:<12} {:<12} {:<6} {:<8} {:<10} {:<6} {:<10} {:<12}".format(
-                l[0], l[1], l[2][:12]+"..." if len(l[2])>12 else l[2], 
-                l[3][:12]+"..." if len(l[3])>12 else l[3], l[4], l[5], l[6], 
-                l[7], l[8], "Yes" if l[9] else "No", "Yes" if l[10] else "No", l[11]))
-    conn.close()
+                "ID", "Emp Code", "Name", "Department", "From", "To", "Days", "Type", "Status", "LOP", "Long Leave", "Experience"))
+        elif shown % HR_PAGE_SIZE == 0:
+            if input("Press Enter for more, or 'q' to stop: ").strip().lower() == 'q':
+                return
+        print("{:<8} {:<10} {:<15} {:<15} {:<12} {:<12} {:<6} {:<8} {:<10} {:<6} {:<10} {:<12}".format(
+            l[0], l[1], l[2][:12]+"..." if len(l[2])>12 else l[2], 
+            l[3][:12]+"..." if len(l[3])>12 else l[3], l[4], l[5], l[6], 
+            l[7], l[8], "Yes" if l[9] else "No", "Yes" if l[10] else "No", l[11]))
+        shown += 1
+    if shown == 0:
+        print("No leave records found.")
+
+def leave_reports_hr():
+    from_month = input("From month (YYYY-MM, blank for any): ").strip()
+    to_month = input("To month (YYYY-MM, blank for any): ").strip()
+    for month in (from_month, to_month):
+        if month and not re.fullmatch(r"\d{4}-\d{2}", month):
+            print("Invalid month format.")
+            return
+    report = analytics.leave_report(from_month or None, to_month or None)
+    if not report["by_department_month"]:
+        print("No approved leave in this period.")
+        return
+    print("\nApproved Leave by Department and Month:")
+    print("{:<8} {:<8} {:<7} {:<6} {:<9} {:<11} {:<9} {:<12} {:<11}".format(
+        "Dept", "Month", "Leaves", "Days", "LOP Days", "Long Leave", "New Days", "Experienced", "Utilization"))
+    for r in report["by_department_month"]:
+        print("{:<8} {:<8} {:<7} {:<6} {:<9} {:<11} {:<9} {:<12} {:<11}".format(
+            r["dept_id"], r["month"], r["leaves"], r["days"], r["lop_days"], r["long_leaves"], r["new_days"],
+            r["experienced_days"], "-" if r["utilization"] is None else f"{r['utilization']:.2%}"))
+    print("\nTotals by Department:")
+    print("{:<8} {:<7} {:<6} {:<9} {:<11} {:<9} {:<12}".format(
+        "Dept", "Leaves", "Days", "LOP Days", "Long Leave", "New Days", "Experienced"))
+    for r in report["by_department"]:
+        print("{:<8} {:<7} {:<6} {:<9} {:<11} {:<9} {:<12}".format(
+            r["dept_id"], r["leaves"], r["days"], r["lop_days"], r["long_leaves"], r["new_days"],
+            r["experienced_days"]))
 
 def edit_department():
-    conn = connect_db()
-    cur = conn.cursor()
     dept_id = input("Enter Department ID to edit: ")
-    cur.execute("SELECT * FROM Department WHERE dept_id=?", (dept_id,))
-    dept = cur.fetchone()
+    dept = service.get_department(dept_id)
     if not dept:
         print("Department not found.")
-        conn.close()
         return
     print(f"Current Department Name: {dept[1]}")
     new_name = input("Enter new Department Name (leave blank to keep current): ").strip()
     if new_name:
-        try:
-            cur.execute("UPDATE Department SET dept_name=? WHERE dept_id=?", (new_name, dept_id))
-            conn.commit()
-            print("Department updated.")
-        except sqlite3.IntegrityError:
-            print("Error updating department.")
+        print(service.rename_department(dept_id, new_name).message)
     else:
         print("No changes made.")
-    conn.close()
 
 def edit_employee_or_head():
-    conn = connect_db()
-    cur = conn.cursor()
     emp_code = input("Enter Employee/Head Code to edit: ")
-    cur.execute("SELECT * FROM Employee WHERE emp_code=?", (emp_code,))
-    emp = cur.fetchone()
-    if emp:
-        table = "Employee"
-    else:
-        cur.execute("SELECT * FROM Head WHERE emp_code=?", (emp_code,))
-        emp = cur.fetchone()
-        if emp:
-            table = "Head"
-        else:
-            print("Employee/Head not found.")
-            conn.close()
-            return
+    table, emp = service.find_person(emp_code)
+    if not emp:
+        print("Employee/Head not found.")
+        return
 
     print(f"Current Name: {emp[1]}")
     new_name = input("New Name (leave blank to keep current): ").strip()
     if new_name and not valid_name(new_name):
         print("Invalid name.")
-        conn.close()
         return
 
     print(f"Current Department: {emp[2]}")
@@ -525,152 +323,72 @@ def edit_employee_or_head():
     print(f"Current Post: {emp[4]}")
     new_post = input("New Post (leave blank to keep current): ").strip()
 
-    update_fields = []
-    update_values = []
-
-    if new_name:
-        update_fields.append("name=?")
-        update_values.append(new_name)
-    if new_dept:
-        update_fields.append("department=?")
-        update_values.append(new_dept)
-    if new_desig:
-        update_fields.append("designation=?")
-        update_values.append(new_desig)
-    if new_post:
-        update_fields.append("post=?")
-        update_values.append(new_post)
-
-    if update_fields:
-        update_values.append(emp_code)
-        sql = f"UPDATE {table} SET {', '.join(update_fields)} WHERE emp_code=?"
-        try:
-            cur.execute(sql, update_values)
-            conn.commit()
-            print(f"{table} details updated.")
-        except sqlite3.IntegrityError:
-            print("Error updating details.")
-    else:
-        print("No changes made.")
-    conn.close()
+    print(service.update_person(emp_code, new_name, new_dept, new_desig, new_post).message)
 
-def delete_record():
-    conn = connect_db()
-    cur = conn.cursor()
+def delete_record(hr_id):
     print("Delete Options:\n1. Department\n2. Employee\n3. Head")
     choice = input("Choose option (1-3): ")
     if choice == '1':
         dept_id = input("Enter Department ID to delete: ")
-        cur.execute("SELECT * FROM Department WHERE dept_id=?", (dept_id,))
-        if cur.fetchone():
+        if service.get_department(dept_id):
             confirm = input(f"Are you sure to delete Department {dept_id}? (yes/no): ")
             if confirm.lower() == 'yes':
-                cur.execute("SELECT * FROM Employee WHERE dept_id=?", (dept_id,))
-                emp_exists = cur.fetchone()
-                cur.execute("SELECT * FROM Head WHERE dept_id=?", (dept_id,))
-                head_exists = cur.fetchone()
-                if emp_exists or head_exists:
-                    print("Cannot delete department: Employees or Heads assigned to this department.")
-                else:
-                    cur.execute("DELETE FROM Department WHERE dept_id=?", (dept_id,))
-                    conn.commit()
-                    print("Department deleted.")
+                print(service.delete_department(dept_id).message)
             else:
                 print("Delete cancelled.")
         else:
             print("Department not found.")
-    elif choice == '2':
-        emp_code = input("Enter Employee Code to delete: ")
-        cur.execute("SELECT * FROM Employee WHERE emp_code=?", (emp_code,))
-        if cur.fetchone():
-            confirm = input(f"Are you sure to delete Employee {emp_code}? (yes/no): ")
-            if confirm.lower() == 'yes':
-                cur.execute("DELETE FROM Employee WHERE emp_code=?", (emp_code,))
-                cur.execute("DELETE FROM Leave WHERE emp_code=?", (emp_code,))
-                conn.commit()
-                print("Employee deleted.")
-            else:
-                print("Delete cancelled.")
-        else:
-            print("Employee not found.")
-    elif choice == '3':
-        emp_code = input("Enter Head Employee Code to delete: ")
-        cur.execute("SELECT * FROM Head WHERE emp_code=?", (emp_code,))
-        if cur.fetchone():
-            confirm = input(f"Are you sure to delete Head {emp_code}? (yes/no): ")
+    elif choice in ('2', '3'):
+        table = "Employee" if choice == '2' else "Head"
+        label = "Employee Code" if choice == '2' else "Head Employee Code"
+        emp_code = input(f"Enter {label} to delete: ")
+        profile = service.employee_profile(emp_code)
+        if profile and profile.role == service.TABLE_ROLES[table]:
+            confirm = input(f"Are you sure to delete {table} {emp_code}? (yes/no): ")
             if confirm.lower() == 'yes':
-                cur.execute("UPDATE Department SET head_emp_code=NULL WHERE head_emp_code=?", (emp_code,))
-                cur.execute("DELETE FROM Head WHERE emp_code=?", (emp_code,))
-                cur.execute("DELETE FROM Leave WHERE emp_code=?", (emp_code,))
-                conn.commit()
-                print("Head deleted.")
+                print(service.delete_person(table, emp_code, hr_id).message)
             else:
                 print("Delete cancelled.")
         else:
-            print("Head not found.")
+            print(f"{table} not found.")
     else:
         print("Invalid choice.")
-    conn.close()
 
-def reset_employee_password(emp_code):
-    conn = connect_db()
-    cur = conn.cursor()
-    
+def _reset_password(table, emp_code):
     current_password = input("Enter current password: ")
-    cur.execute("SELECT password FROM Employee WHERE emp_code=?", (emp_code,))
-    db_password = cur.fetchone()[0]
-    
-    if current_password != db_password:
+    if not service.verify_password(table, emp_code, current_password):
         print("Incorrect current password.")
-        conn.close()
         return
-    
+
     new_password = input("Enter new password: ")
     confirm_password = input("Confirm new password: ")
-    
+
     if new_password != confirm_password:
         print("Passwords don't match.")
-        conn.close()
         return
-    
-    try:
-        cur.execute("UPDATE Employee SET password=? WHERE emp_code=?", (new_password, emp_code))
-        conn.commit()
-        print("Password updated successfully.")
-    except sqlite3.Error as e:
-        print("Error updating password:", e)
-    finally:
-        conn.close()
+
+    print(service.change_password(table, emp_code, current_password, new_password).message)
+
+def reset_employee_password(emp_code):
+    _reset_password("Employee", emp_code)
 
 def reset_head_password(head_code):
-    conn = connect_db()
-    cur = conn.cursor()
-    
-    current_password = input("Enter current password: ")
-    cur.execute("SELECT password FROM Head WHERE emp_code=?", (head_code,))
-    db_password = cur.fetchone()[0]
-    
-    if current_password != db_password:
-        print("Incorrect current password.")
-        conn.close()
-        return
-    
-    new_password = input("Enter new password: ")
-    confirm_password = input("Confirm new password: ")
-    
-    if new_password != confirm_password:
-        print("Passwords don't match.")
-        conn.close()
+    _reset_password("Head", head_code)
+
+def process_head_leaves_hr(hr):
+    rows = service.head_pending_leaves()
+    if not rows:
+        print("No requests currently.")
         return
-    
-    try:
-        cur.execute("UPDATE Head SET password=? WHERE emp_code=?", (new_password, head_code))
-        conn.commit()
-        print("Password updated successfully.")
-    except sqlite3.Error as e:
-        print("Error updating password:", e)
-    finally:
-        conn.close()
+
+    decisions = []
+    for row in rows:
+        leave_id, emp_code, name, dept_id, from_date, to_date, days, reason, leave_type = row
+        print(f"\nLeave ID: {leave_id}, Head: {emp_code}, Name: {name}, Dept: {dept_id}, From: {from_date}, To: {to_date}, Days: {days}, Type: {leave_type}, Reason: {reason}")
+        choice = input("Approve (a) or Reject (r): ").lower()
+        decisions.append((leave_id, choice == 'a'))
+    result = service.decide_head_leaves(decisions, hr[0])
+    print(result.message)
 
 def hr_menu(hr):
     while True:
@@ -681,7 +399,9 @@ def hr_menu(hr):
         print("4. Edit Department")
         print("5. Edit Employee/Head")
         print("6. Delete Department/Employee/Head")
-        print("7. Logout")
+        print("7. Leave Reports")
+        print("8. Process Head Leave Requests")
+        print("9. Logout")
         choice = input("Enter choice: ")
         if choice == '1':
             create_department()
@@ -694,8 +414,12 @@ def hr_menu(hr):
         elif choice == '5':
             edit_employee_or_head()
         elif choice == '6':
-            delete_record()
+            delete_record(hr[0])
         elif choice == '7':
+            leave_reports_hr()
+        elif choice == '8':
+            process_head_leaves_hr(hr)
+        elif choice == '9':
             break
         else:
             print("Invalid choice.")
@@ -726,14 +450,17 @@ def head_menu(head):
     while True:
         print(f"\nWelcome Department Head: {head[1]}")
         print("1. Process Leave Requests")
-        print("2. Reset Password")
-        print("3. Logout")
+        print("2. Bulk Process Leave Requests")
+        print("3. Reset Password")
+        print("4. Logout")
         choice = input("Enter choice: ")
         if choice == '1':
             process_head_leaves(head)
         elif choice == '2':
-            reset_head_password(head[0])
+            bulk_process_head_leaves(head)
         elif choice == '3':
+            reset_head_password(head[0])
+        elif choice == '4':
             break
         else:
             print("Invalid choice.")
@@ -768,5 +495,219 @@ def main_menu():
         else:
             print("Invalid choice.")
 
+def run_import(args):
+    create_tables()
+    result = bulk_import.import_file(args.path, args.hr)
+    print(result.message)
+    if result.ok:
+        for where, error in result.data["errors"]:
+            print(f"  {where}: {error}")
+    return 0 if result.ok else 1
+
+def run_export(args):
+    create_tables()
+    result = export.export_leaves(args.out, args.format, dept_id=args.dept, status=args.status,
+                                  from_date=args.from_date, to_date=args.to_date, lop_only=args.lop_only)
+    print(result.message)
+    return 0 if result.ok else 1
+
+def shard_prefix(shard):
+    return f"[{shard}] " if db.is_sharded() else ""
+
+def run_status(args):
+    create_tables()
+    try:
+        today = service.parse_date(args.date) if args.date else None
+    except ValueError:
+        print("Invalid date format.")
+        return 1
+    # Maintenance jobs run on every shard, in parallel.
+    print(f"{sum(db.fan_out(lifecycle.run_daily, today).values())} live statuses updated.")
+    print(f"{sum(db.fan_out(service.prune_inbox_changes).values())} old inbox changes pruned.")
+    return 0
+
+def run_archive(args):
+    create_tables()
+    try:
+        today = service.parse_date(args.date) if args.date else None
+    except ValueError:
+        print("Invalid date format.")
+        return 1
+    moved = db.fan_out(archive.run, today, args.horizon_days, args.chunk_size)
+    print(f"{sum(moved.values())} closed leaves archived.")
+    return 0
+
+def run_calendar(args):
+    create_tables()
+    if args.action == "list":
+        holidays = service.list_holidays(args.dept, args.year)
+        if not holidays:
+            print("No holidays found.")
+        for holiday_date, name, scope in holidays:
+            print("{:<12} {:<6} {}".format(holiday_date, "All" if scope == "*" else scope, name))
+        return 0
+    if args.action == "add":
+        result = service.add_holiday(args.date, args.name, args.dept)
+    elif args.action == "remove":
+        result = service.remove_holiday(args.date, args.dept)
+    else:
+        result = service.set_weekly_offs(None if args.reset else args.weekdays, args.dept)
+    print(result.message)
+    return 0 if result.ok else 1
+
+def run_accrual(args):
+    create_tables()
+    if args.year_end is not None:
+        for shard, closed in db.fan_out(accrual.year_end, args.year_end, args.chunk_size, args.cap).items():
+            print(f"{shard_prefix(shard)}Year end {args.year_end}: {closed['people']} accounts, "
+                  f"{closed['forfeited']} days forfeited, {closed['granted']} days granted.")
+        return 0
+    try:
+        today = service.parse_date(args.date) if args.date else None
+    except ValueError:
+        print("Invalid date format.")
+        return 1
+    for shard, result in db.fan_out(accrual.run, today, args.chunk_size, args.cap).items():
+        print(shard_prefix(shard) + result.message)
+    return 0
+
+def run_events(args):
+    create_tables()
+    if args.action == "checkpoint":
+        for shard, made in db.fan_out(events.checkpoint).items():
+            if made is None:
+                print(f"{shard_prefix(shard)}No new events since the last checkpoint.")
+            else:
+                print(f"{shard_prefix(shard)}Checkpoint {made['checkpoint_id']}: {made['leaves']} leaves and "
+                      f"{made['balances']} balances up to event {made['event_id']}.")
+        return 0
+    if args.action == "verify":
+        found = events.mismatches()
+        for kind, key in found:
+            print(f"{kind} {key} differs from the event log")
+        print(f"{len(found)} mismatches.")
+        return 0 if not found else 1
+    if args.action == "history":
+        for event_id, event, actor, data, created_at in events.history(args.leave_id):
+            print("{:<8} {:<20} {:<10} {:<8} {}".format(event_id, created_at, event, actor or "-", data or ""))
+        return 0
+    leaves, balances = events.state_at(args.at, args.emp)
+    with open(args.out, "w") if args.out else nullcontext(sys.stdout) as out:
+        for leave_id in sorted(leaves):
+            out.write(json.dumps({"leave_id": leave_id, **dict(zip(events.LEAVE_FIELDS, leaves[leave_id]))}) + "\n")
+        for emp_code in sorted(balances):
+            out.write(json.dumps({"emp_code": emp_code, "leave_balance": balances[emp_code]}) + "\n")
+    return 0
+
+def run_queue(args):
+    create_tables()
+    if args.action == "drain":
+        print(f"{submissions.drain()} queued applications decided.")
+        return 0
+    receipt = submissions.status(args.receipt)
+    if receipt is None:
+        print("Unknown receipt.")
+        return 1
+    print(f"{receipt['status']}: {receipt['message'] or '-'}")
+    return 0
+
+def run_server(args):
+    create_tables()
+    server.run(args.host, args.port, args.readers, args.queue)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leave Management System")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time SQL statements and service calls; print a report on exit")
+    commands = parser.add_subparsers(dest="command")
+
+    importer = commands.add_parser("import", help="Bulk import departments and employees from CSV/JSON")
+    importer.add_argument("path", help="CSV, JSON Lines or JSON array file")
+    importer.add_argument("--hr", required=True, help="HR name recorded as created_by_hr")
+    importer.set_defaults(handler=run_import)
+
+    exporter = commands.add_parser("export", help="Export leave records to CSV, JSON Lines or Parquet")
+    exporter.add_argument("out", help="Output file")
+    exporter.add_argument("--format", choices=sorted(export.WRITERS), default="csv")
+    exporter.add_argument("--dept", help="Only this department ID")
+    exporter.add_argument("--status", choices=service.LEAVE_STATUSES)
+    exporter.add_argument("--from", dest="from_date", help="Leaves ending on or after YYYY-MM-DD")
+    exporter.add_argument("--to", dest="to_date", help="Leaves starting on or before YYYY-MM-DD")
+    exporter.add_argument("--lop-only", action="store_true", help="Only loss-of-pay leaves")
+    exporter.set_defaults(handler=run_export)
+
+    accrue = commands.add_parser("accrue", help="Year-end rollover and anniversary accrual (safe to run daily)")
+    accrue.add_argument("--date", help="Run as of YYYY-MM-DD (default: today)")
+    accrue.add_argument("--year-end", type=int, metavar="YEAR", help="Only close the given leave year")
+    accrue.add_argument("--cap", type=int, default=accrual.CARRY_FORWARD_CAP, help="Carry-forward cap in days")
+    accrue.add_argument("--chunk-size", type=int, default=accrual.CHUNK_SIZE)
+    accrue.set_defaults(handler=run_accrual)
+
+    status = commands.add_parser("update-status", help="Daily live_status update from approved long leaves")
+    status.add_argument("--date", help="Run as of YYYY-MM-DD (default: today)")
+    status.set_defaults(handler=run_status)
+
+    archiver = commands.add_parser("archive", help="Move old closed leaves to the archive database")
+    archiver.add_argument("--date", help="Run as of YYYY-MM-DD (default: today)")
+    archiver.add_argument("--horizon-days", type=int, default=archive.HORIZON_DAYS,
+                          help="Archive leaves that ended more than this many days ago")
+    archiver.add_argument("--chunk-size", type=int, default=archive.CHUNK_SIZE)
+    archiver.set_defaults(handler=run_archive)
+
+    calendar = commands.add_parser("calendar", help="Manage holidays and weekly offs")
+    calendar.add_argument("--dept", help="Department ID (default: company-wide)")
+    calendar.set_defaults(handler=run_calendar)
+    actions = calendar.add_subparsers(dest="action", required=True)
+    holidays = actions.add_parser("list", help="List holidays")
+    holidays.add_argument("--year", type=int)
+    holiday = actions.add_parser("add", help="Add a holiday")
+    holiday.add_argument("date", help="YYYY-MM-DD")
+    holiday.add_argument("name")
+    holiday = actions.add_parser("remove", help="Remove a holiday")
+    holiday.add_argument("date", help="YYYY-MM-DD")
+    weekly_offs = actions.add_parser("weekly-offs", help="Set weekly off days (0=Monday ... 6=Sunday)")
+    weekly_offs.add_argument("weekdays", type=int, nargs="*")
+    weekly_offs.add_argument("--reset", action="store_true", help="Use the company-wide weekly offs again")
+
+    log = commands.add_parser("events", help="Leave event log: checkpoints, verification and replay")
+    log.set_defaults(handler=run_events)
+    actions = log.add_subparsers(dest="action", required=True)
+    actions.add_parser("checkpoint", help="Store replayed state so later replays start from here")
+    actions.add_parser("verify", help="Compare live leaves and balances with the replayed log")
+    history = actions.add_parser("history", help="Events of one leave")
+    history.add_argument("leave_id", type=int)
+    replay = actions.add_parser("replay", help="Leaves and balances rebuilt from the log, as JSON lines")
+    replay.add_argument("--at", help="As of this UTC time, YYYY-MM-DD HH:MM:SS (default: now)")
+    replay.add_argument("--emp", help="Only this employee")
+    replay.add_argument("--out", help="Output file (default: stdout)")
+
+    spool = commands.add_parser("queue", help="Queued leave applications")
+    spool.set_defaults(handler=run_queue)
+    actions = spool.add_subparsers(dest="action", required=True)
+    actions.add_parser("drain", help="Apply everything queued now")
+    receipt = actions.add_parser("status", help="Status of one receipt")
+    receipt.add_argument("receipt")
+
+    serve = commands.add_parser("serve", help="Serve the JSON API over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--readers", type=int, default=server.READ_WORKERS, help="Threads serving read requests")
+    serve.add_argument("--queue", action="store_true",
+                       help="Accept POST /leaves/submissions and apply them in batches")
+    serve.set_defaults(handler=run_server)
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
+    try:
+        if args.command is None:
+            main_menu()
+            return 0
+        return args.handler(args)
+    finally:
+        if args.profile:
+            print(profiling.report(), file=sys.stderr)
+
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    sys.exit(main())
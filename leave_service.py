@@ -0,0 +1,901 @@
+import datetime
+import inspect
+import json
+import re
+import sqlite3
+from collections import namedtuple
+from functools import wraps
+
+import auth
+import cache
+import db
+import events
+import ledger
+import lifecycle
+import profiling
+import workdays
+from db import connection, transaction
+from schema import PERSON_COLUMNS, PERSON_INSERT
+
+Result = namedtuple("Result", "ok message data", defaults=(None,))
+Profile = namedtuple("Profile", "join_date dept_id role")
+Application = namedtuple("Application", "emp_code from_dt to_dt leave_type reason dept_id experience")
+
+LEAVE_TYPES = ['Casual', 'Sick', 'Earned', 'Combo']
+TABLE_ROLES = {"HR": "hr", "Employee": "employee", "Head": "head"}
+ROLE_TABLES = {"employee": "Employee", "head": "Head"}
+
+
+def valid_name(name):
+    return bool(re.fullmatch(r"[A-Za-z\s\.\'-]+", name))
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def experience_days(join_date, today=None):
+    return ((today or datetime.date.today()) - parse_date(join_date)).days
+
+
+def _has_person(emp_code):
+    # Relieved people count too; their codes are never reused.
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM Person WHERE emp_code=?", (emp_code,)).fetchone() is not None
+
+
+def _locate_person(emp_code):
+    found = db.fan_out(_has_person, emp_code)
+    return next((shard for shard, exists in found.items() if exists), None)
+
+
+# emp_code -> home shard (None for unknown codes). People never change shard,
+# so only create_employee and the bulk import need to invalidate.
+_homes = cache.ReadThroughCache(_locate_person)
+
+
+def person_shard(emp_code):
+    # Unknown codes go to the default shard, where their lookups come up empty.
+    if not db.is_sharded():
+        return db.current_shard()
+    return _homes.get(emp_code) or db.default_shard()
+
+
+ALL_SHARDS = object()
+
+
+def _scope_shard(dept_id):
+    # Company-wide calendar entries (no department) are kept in every shard.
+    return db.shard_for_dept(dept_id) if dept_id else ALL_SHARDS
+
+
+def _routed(locate, param):
+    # Runs the call on the shard that locate(<param>) names, or on every shard
+    # for ALL_SHARDS (returning the first failed Result, else the default
+    # shard's). A plain call when there is no shard map.
+    def decorate(func):
+        position = list(inspect.signature(func).parameters).index(param)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not db.is_sharded():
+                return func(*args, **kwargs)
+            shard = locate(args[position] if position < len(args) else kwargs.get(param))
+            if shard is ALL_SHARDS:
+                results = db.fan_out(func, *args, **kwargs)
+                return next((result for result in results.values() if not result.ok),
+                            results[db.default_shard()])
+            with db.use_shard(shard):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def check_hr_id(hr_id):
+    if not re.fullmatch(r'^HR\d{4}$', hr_id):
+        return Result(False, "Invalid HR ID format. Must start with 'HR' followed by 4 digits.")
+    if any(db.fan_out(_has_person, hr_id).values()):
+        return Result(False, "This ID is already used as an employee code. Please choose a different HR ID.")
+    return Result(True, "")
+
+
+def register_hr(hr_id, name, designation, username, password):
+    checked = check_hr_id(hr_id)
+    if not checked.ok:
+        return checked
+    if not valid_name(name):
+        return Result(False, "Invalid name.")
+    try:
+        with transaction(shard=db.default_shard()) as cur:
+            cur.execute("INSERT INTO HR VALUES (?, ?, ?, ?, ?)",
+                        (hr_id, name, designation, username, auth.hash_password(password)))
+    except sqlite3.IntegrityError:
+        return Result(False, "HR ID or Username already exists.")
+    return Result(True, "HR Registered Successfully.")
+
+
+@profiling.timed
+def login_hr(username, password):
+    hr_id = auth.check_credentials("hr", username, password)
+    if hr_id is None:
+        return Result(False, "Not a Registered HR. Please Register.")
+    with connection() as conn:
+        return Result(True, "", conn.execute("SELECT * FROM HR WHERE hr_id=?", (hr_id,)).fetchone())
+
+
+def get_hr(hr_id):
+    with connection() as conn:
+        return conn.execute("SELECT * FROM HR WHERE hr_id=?", (hr_id,)).fetchone()
+
+
+@_routed(person_shard, "username")
+def _login_person(table, username, password):
+    # Usernames are the employee codes (see create_employee).
+    emp_code = auth.check_credentials(TABLE_ROLES[table], username, password)
+    if emp_code is None:
+        return Result(False, "Login Failed.")
+    return Result(True, "", find_person(emp_code)[1])
+
+
+@profiling.timed
+def login_employee(username, password):
+    return _login_person("Employee", username, password)
+
+
+@profiling.timed
+def login_head(username, password):
+    return _login_person("Head", username, password)
+
+
+@profiling.timed
+def login(role, username, password):
+    # Token-based login for non-interactive callers; see auth.resolve().
+    with db.use_shard(db.default_shard() if role == "hr" else person_shard(username)):
+        session = auth.login(role, username, password)
+    if session is None:
+        return Result(False, "Login Failed.")
+    return Result(True, "", session)
+
+
+def _load_department(dept_id):
+    with connection(db.shard_for_dept(dept_id)) as conn:
+        return conn.execute("SELECT * FROM Department WHERE dept_id=?", (dept_id,)).fetchone()
+
+
+def _load_profile(emp_code):
+    with connection(person_shard(emp_code)) as conn:
+        row = conn.execute("SELECT join_date, dept_id, role FROM Person WHERE emp_code=? AND relieve_date IS NULL",
+                           (emp_code,)).fetchone()
+    return Profile(*row) if row else None
+
+
+# Department rows (including the head mapping) and the parts of a person that
+# only change through this module. Misses are cached too, so repeated checks
+# for an unknown ID don't reach the database either.
+_departments = cache.ReadThroughCache(_load_department)
+_profiles = cache.ReadThroughCache(_load_profile)
+
+
+def get_department(dept_id):
+    return _departments.get(dept_id)
+
+
+def employee_profile(emp_code):
+    # Profile(join_date, dept_id, role) or None; never the balance, which
+    # changes on every approval.
+    return _profiles.get(emp_code)
+
+
+def invalidate_metadata():
+    # For writers outside this module, e.g. the bulk import.
+    _departments.invalidate()
+    _profiles.invalidate()
+    _homes.invalidate()
+
+
+def cache_stats():
+    return {"departments": _departments.stats(), "profiles": _profiles.stats(), "homes": _homes.stats()}
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def create_department(dept_id, dept_name):
+    if len(dept_id) != 4:
+        return Result(False, "Department ID must be 4 characters.")
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT INTO Department VALUES (?, ?, NULL)", (dept_id, dept_name))
+    except sqlite3.IntegrityError:
+        return Result(False, "Department ID already exists.")
+    finally:
+        _departments.invalidate(dept_id)
+    return Result(True, "Department Created.")
+
+
+@_routed(db.shard_for_dept, "dept_id")
+def rename_department(dept_id, new_name):
+    if not get_department(dept_id):
+        return Result(False, "Department not found.")
+    try:
+        with transaction() as cur:
+            cur.execute("UPDATE Department SET dept_name=? WHERE dept_id=?", (new_name, dept_id))
+    except sqlite3.IntegrityError:
+        return Result(False, "Error updating department.")
+    finally:
+        _departments.invalidate(dept_id)
+    return Result(True, "Department updated.")
+
+
+@_routed(db.shard_for_dept, "dept_id")
+def delete_department(dept_id):
+    with transaction() as cur:
+        if not cur.execute("SELECT 1 FROM Department WHERE dept_id=?", (dept_id,)).fetchone():
+            return Result(False, "Department not found.")
+        if cur.execute("SELECT 1 FROM Person WHERE dept_id=? AND relieve_date IS NULL", (dept_id,)).fetchone():
+            return Result(False, "Cannot delete department: Employees or Heads assigned to this department.")
+        cur.execute("DELETE FROM Department WHERE dept_id=?", (dept_id,))
+        cur.execute("DELETE FROM Holiday WHERE scope=?", (dept_id,))
+        cur.execute("DELETE FROM WorkWeek WHERE scope=?", (dept_id,))
+    _departments.invalidate(dept_id)
+    return Result(True, "Department deleted.")
+
+
+@_routed(db.shard_for_dept, "dept_id")
+def list_holidays(dept_id=None, year=None):
+    # Company-wide holidays plus the department's own, by date.
+    with connection() as conn:
+        return conn.execute('''SELECT holiday_date, name, scope FROM Holiday
+                               WHERE scope IN ('*', ?) AND holiday_date GLOB ?
+                               ORDER BY holiday_date''', (dept_id or '*', f"{year}-*" if year else "*")).fetchall()
+
+
+@_routed(_scope_shard, "dept_id")
+def add_holiday(holiday_date, name, dept_id=None):
+    try:
+        holiday_date = parse_date(holiday_date).isoformat()
+    except ValueError:
+        return Result(False, "Invalid date format.")
+    if dept_id and not get_department(dept_id):
+        return Result(False, "Department not found.")
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT INTO Holiday (scope, holiday_date, name) VALUES (?, ?, ?)",
+                        (dept_id or workdays.ALL_DEPARTMENTS, holiday_date, name))
+    except sqlite3.IntegrityError:
+        return Result(False, "A holiday already exists on that date.")
+    return Result(True, "Holiday Added.")
+
+
+@_routed(_scope_shard, "dept_id")
+def remove_holiday(holiday_date, dept_id=None):
+    with transaction() as cur:
+        cur.execute("DELETE FROM Holiday WHERE scope=? AND holiday_date=?",
+                    (dept_id or workdays.ALL_DEPARTMENTS, holiday_date))
+        if cur.rowcount == 0:
+            return Result(False, "Holiday not found.")
+    return Result(True, "Holiday Removed.")
+
+
+@_routed(_scope_shard, "dept_id")
+def set_weekly_offs(weekdays, dept_id=None):
+    # weekdays: Monday = 0 ... Sunday = 6. For a department, None drops its
+    # override so the company-wide weekly offs apply again.
+    scope = dept_id or workdays.ALL_DEPARTMENTS
+    if dept_id and not get_department(dept_id):
+        return Result(False, "Department not found.")
+    with transaction() as cur:
+        if weekdays is None:
+            if scope == workdays.ALL_DEPARTMENTS:
+                return Result(False, "Company-wide weekly offs cannot be removed.")
+            cur.execute("DELETE FROM WorkWeek WHERE scope=?", (scope,))
+            return Result(True, "Weekly Offs Reset.")
+        if any(day not in range(7) for day in weekdays) or len(set(weekdays)) == 7:
+            return Result(False, "Weekly offs must be distinct weekdays 0-6 and leave at least one working day.")
+        cur.execute('''INSERT INTO WorkWeek (scope, weekly_offs) VALUES (?, ?)
+                       ON CONFLICT(scope) DO UPDATE SET weekly_offs = excluded.weekly_offs''',
+                    (scope, ",".join(str(day) for day in sorted(set(weekdays)))))
+    return Result(True, "Weekly Offs Updated.")
+
+
+def check_emp_code(emp_code):
+    if not emp_code.isdigit() or len(emp_code) != 6:
+        return Result(False, "Employee Code must be 6 digits.")
+    with connection(db.default_shard()) as conn:
+        if conn.execute("SELECT 1 FROM HR WHERE hr_id=?", (emp_code,)).fetchone():
+            return Result(False, "This code is already used as an HR ID. Please choose a different employee code.")
+    if any(db.fan_out(_has_person, emp_code).values()):
+        return Result(False, "Employee code already exists.")
+    return Result(True, "")
+
+
+# Yearly leave days for employees with at least / under one year's experience.
+SENIOR_ENTITLEMENT = 36
+JUNIOR_ENTITLEMENT = 12
+
+
+def initial_leave_balance(join_date, today=None):
+    return SENIOR_ENTITLEMENT if experience_days(join_date, today) >= 365 else JUNIOR_ENTITLEMENT
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def create_employee(hr_name, emp_code, name, department, dept_id, designation, post, join_date, password,
+                    is_head=False):
+    checked = check_emp_code(emp_code)
+    if not checked.ok:
+        return checked
+    if not valid_name(name):
+        return Result(False, "Invalid name.")
+    if not get_department(dept_id):
+        return Result(False, "Department not created. Please create department first.")
+    try:
+        leave_balance = initial_leave_balance(join_date)
+    except ValueError:
+        return Result(False, "Invalid date format.")
+
+    try:
+        with transaction() as cur:
+            cur.execute(PERSON_INSERT,
+                        (emp_code, name, department, designation, post, dept_id, join_date, None, leave_balance,
+                         'live', emp_code, auth.hash_password(password), hr_name, "head" if is_head else "employee"))
+            ledger.open_accounts(cur, [emp_code])
+            if is_head:
+                cur.execute("UPDATE Department SET head_emp_code=? WHERE dept_id=?", (emp_code, dept_id))
+    except sqlite3.IntegrityError as e:
+        return Result(False, f"Error in creating employee: {e}")
+    finally:
+        _profiles.invalidate(emp_code)
+        _homes.invalidate(emp_code)
+        if is_head:
+            _departments.invalidate(dept_id)
+    return Result(True, "Employee Added.", {"emp_code": emp_code, "leave_balance": leave_balance})
+
+
+@_routed(person_shard, "emp_code")
+def find_person(emp_code):
+    # Returns ("Employee" or "Head", row in the Employee/Head column order).
+    with connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(PERSON_COLUMNS)}, role FROM Person "
+                           "WHERE emp_code=? AND relieve_date IS NULL", (emp_code,)).fetchone()
+    if not row:
+        return None, None
+    return ROLE_TABLES[row[-1]], row[:-1]
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def update_person(emp_code, name=None, department=None, designation=None, post=None):
+    table, row = find_person(emp_code)
+    if not row:
+        return Result(False, "Employee/Head not found.")
+    if name and not valid_name(name):
+        return Result(False, "Invalid name.")
+
+    changes = {"name": name, "department": department, "designation": designation, "post": post}
+    changes = {column: value for column, value in changes.items() if value}
+    if not changes:
+        return Result(False, "No changes made.")
+
+    sql = f"UPDATE Person SET {', '.join(column + '=?' for column in changes)} WHERE emp_code=?"
+    try:
+        with transaction() as cur:
+            cur.execute(sql, [*changes.values(), emp_code])
+    except sqlite3.IntegrityError:
+        return Result(False, "Error updating details.")
+    return Result(True, f"{table} details updated.")
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def delete_person(table, emp_code, actor=None, today=None):
+    # Soft delete: the person is relieved as of today and keeps their leave
+    # history; pending requests are cancelled.
+    today = today or datetime.date.today()
+    with transaction() as cur:
+        if not cur.execute("SELECT 1 FROM Person WHERE emp_code=? AND role=? AND relieve_date IS NULL",
+                           (emp_code, TABLE_ROLES[table])).fetchone():
+            return Result(False, f"{table} not found.")
+        if table == "Head":
+            cur.execute("UPDATE Department SET head_emp_code=NULL WHERE head_emp_code=?", (emp_code,))
+        cur.execute("UPDATE Person SET relieve_date=?, live_status='relieved' WHERE emp_code=?",
+                    (today.isoformat(), emp_code))
+        pending = [row[0] for row in cur.execute(
+            "SELECT leave_id FROM Leave WHERE emp_code=? AND status='pending'", (emp_code,))]
+        cur.executemany("UPDATE Leave SET status='cancelled' WHERE leave_id=?", [(leave_id,) for leave_id in pending])
+        events.record(cur, [(leave_id, emp_code, 'cancelled', actor, None) for leave_id in pending])
+    auth.end_sessions(TABLE_ROLES[table], emp_code)
+    _profiles.invalidate(emp_code)
+    if table == "Head":
+        _departments.invalidate()
+    return Result(True, f"{table} deleted.")
+
+
+@_routed(person_shard, "emp_code")
+def verify_password(table, emp_code, password):
+    return auth.check_credentials(TABLE_ROLES[table], emp_code, password, by_id=True) is not None
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def change_password(table, emp_code, current_password, new_password):
+    if not verify_password(table, emp_code, current_password):
+        return Result(False, "Incorrect current password.")
+    try:
+        with transaction() as cur:
+            cur.execute("UPDATE Person SET password=? WHERE emp_code=?",
+                        (auth.hash_password(new_password), emp_code))
+    except sqlite3.Error as e:
+        return Result(False, f"Error updating password: {e}")
+    auth.end_sessions(TABLE_ROLES[table], emp_code)
+    return Result(True, "Password updated successfully.")
+
+
+def _add_usage(cur, emp_code, from_date, days):
+    cur.execute('''INSERT INTO LeaveUsage (emp_code, month, approved_days) VALUES (?, ?, ?)
+                   ON CONFLICT(emp_code, month) DO UPDATE SET approved_days = approved_days + excluded.approved_days''',
+                (emp_code, from_date[:7], days))
+
+
+def approved_days_in_month(cur, emp_code, day):
+    row = cur.execute("SELECT approved_days FROM LeaveUsage WHERE emp_code=? AND month=?",
+                      (emp_code, day.strftime("%Y-%m"))).fetchone()
+    return row[0] if row else 0
+
+
+def overlapping_leave(cur, emp_code, from_date, to_date):
+    # A pending/approved leave sharing a day with [from_date, to_date],
+    # archived ones included. Older and bulk-loaded rows were never checked
+    # against each other, so every candidate is tested rather than only the
+    # latest; both probes stay inside a covering partial index.
+    return cur.execute('''SELECT leave_id, from_date, to_date FROM main.Leave
+                          WHERE emp_code=? AND status IN ('pending','approved') AND from_date <= ? AND to_date >= ?
+                          UNION ALL
+                          SELECT leave_id, from_date, to_date FROM archive.Leave
+                          WHERE emp_code=? AND status='approved' AND from_date <= ? AND to_date >= ?
+                          LIMIT 1''', (emp_code, to_date, from_date) * 2).fetchone()
+
+
+def check_application(emp_code, from_date, to_date, leave_type, reason, today=None):
+    # The checks that need no write lock. Result.data is the Application to
+    # pass to record_application().
+    today = today or datetime.date.today()
+    profile = employee_profile(emp_code)
+    if not profile:
+        return Result(False, "Employee not found.")
+    experience = experience_days(profile.join_date, today)
+
+    # Employees with <1 year experience can only take Casual leave
+    if experience < 365 and leave_type != 'Casual':
+        return Result(False, "Employees with less than one year experience can only take Casual leave.")
+    if leave_type not in LEAVE_TYPES:
+        return Result(False, "Invalid leave type.")
+
+    try:
+        from_dt = parse_date(from_date)
+        to_dt = parse_date(to_date)
+    except ValueError:
+        return Result(False, "Invalid date format.")
+    if to_dt < from_dt:
+        return Result(False, "To Date cannot be before From Date.")
+    return Result(True, "", Application(emp_code, from_dt, to_dt, leave_type, reason, profile.dept_id, experience))
+
+
+def record_application(cur, application, today=None):
+    # Overlap, quota and balance checks and the insert, all under the caller's
+    # write transaction so they see one consistent state.
+    today = today or datetime.date.today()
+    emp_code, from_dt, to_dt, leave_type, reason, dept_id, experience = application
+    # Store zero-padded ISO dates so the range comparisons below hold.
+    from_date, to_date = from_dt.isoformat(), to_dt.isoformat()
+    is_lop = False
+    lop_days = 0
+
+    overlap = overlapping_leave(cur, emp_code, from_date, to_date)
+    if overlap:
+        return Result(False, f"Leave overlaps your existing leave {overlap[0]} ({overlap[1]} to {overlap[2]}).")
+    # Weekly offs and holidays inside the range are not charged.
+    days = workdays.working_days(cur, dept_id, from_dt, to_dt)
+    if days == 0:
+        return Result(False, "The selected dates are all holidays or weekly offs.")
+    is_long = days > 4
+
+    # Check leave balance and restrictions
+    if experience < 365:
+        approved_days_this_month = approved_days_in_month(cur, emp_code, today)
+
+        if approved_days_this_month + days > 1:  # Only 1 casual leave allowed per month
+            lop_days = (approved_days_this_month + days) - 1
+            is_lop = True
+    else:
+        # Read under the write lock; the profile cache never holds balances.
+        row = cur.execute("SELECT leave_balance FROM Person WHERE emp_code=?", (emp_code,)).fetchone()
+        is_lop = not row or row[0] < days
+
+    cur.execute('''INSERT INTO Leave (emp_code, from_date, to_date, days, reason, leave_type, is_lop, is_long_leave)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (emp_code, from_date, to_date, days, reason, leave_type, is_lop, is_long))
+    leave_id = cur.lastrowid
+    events.record(cur, [(leave_id, emp_code, 'applied', emp_code,
+                         {"from_date": from_date, "to_date": to_date, "days": days, "reason": reason,
+                          "leave_type": leave_type, "is_lop": is_lop, "is_long_leave": is_long})])
+
+    return Result(True, "Leave Applied.",
+                  {"leave_id": leave_id, "days": days, "is_lop": is_lop, "lop_days": lop_days,
+                   "is_long_leave": is_long})
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def apply_leave(emp_code, from_date, to_date, leave_type, reason, today=None):
+    today = today or datetime.date.today()
+    checked = check_application(emp_code, from_date, to_date, leave_type, reason, today)
+    if not checked.ok:
+        return checked
+    with transaction() as cur:
+        return record_application(cur, checked.data, today)
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def leave_history(emp_code):
+    with connection() as conn:
+        return conn.execute("""
+            SELECT leave_id, from_date, to_date, days, reason, leave_type, status, is_lop, is_long_leave
+            FROM AllLeaves
+            WHERE emp_code=?
+        """, (emp_code,)).fetchall()
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def cancellable_leaves(emp_code):
+    with connection() as conn:
+        return conn.execute("""
+            SELECT leave_id, from_date, to_date, days, reason, leave_type, status
+            FROM Leave
+            WHERE emp_code=? AND status IN ('pending', 'approved')
+        """, (emp_code,)).fetchall()
+
+
+def _cancellable_leave(cur, emp_code, leave_id):
+    return cur.execute("""
+        SELECT status, days, is_lop, is_long_leave, from_date
+        FROM Leave
+        WHERE leave_id=? AND emp_code=? AND status IN ('pending', 'approved')
+    """, (leave_id, emp_code)).fetchone()
+
+
+@_routed(person_shard, "emp_code")
+def can_cancel(emp_code, leave_id):
+    with connection() as conn:
+        return _cancellable_leave(conn, emp_code, leave_id) is not None
+
+
+@profiling.timed
+@_routed(person_shard, "emp_code")
+def cancel_leave(emp_code, leave_id):
+    try:
+        with transaction() as cur:
+            leave_info = _cancellable_leave(cur, emp_code, leave_id)
+            if not leave_info:
+                return Result(False, "Invalid Leave ID or leave cannot be cancelled.")
+            status, days, is_lop, is_long_leave, from_date = leave_info
+
+            cur.execute("UPDATE Leave SET status='cancelled' WHERE leave_id=?", (leave_id,))
+            events.record(cur, [(leave_id, emp_code, 'cancelled', emp_code, None)])
+            if status == 'approved':
+                _add_usage(cur, emp_code, from_date, -days)
+
+            # Give back exactly what approval took; leaves approved before the
+            # ledger existed fall back to the old "approved and not LOP" rule.
+            if status == 'approved':
+                charged = ledger.charged_for_leave(cur, leave_id)
+                if charged is None:
+                    charged = 0 if is_lop else days
+                if charged:
+                    ledger.post(cur, emp_code, charged, 'cancel', leave_id)
+
+            if is_long_leave and status == 'approved':
+                lifecycle.refresh(cur, [emp_code])
+    except (sqlite3.Error, ledger.BalanceConflict) as e:
+        return Result(False, f"Error cancelling leave: {e}")
+    return Result(True, "Leave successfully cancelled.")
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def pending_leaves(dept_id):
+    with connection() as conn:
+        return conn.execute('''SELECT I.leave_id, I.emp_code, E.name, I.from_date, I.to_date, I.days, I.reason, I.leave_type
+                               FROM PendingInbox I JOIN Person E ON E.emp_code = I.emp_code
+                               WHERE I.dept_id=? ORDER BY I.leave_id''', (dept_id,)).fetchall()
+
+
+# Lower bounds in days since the request was applied for.
+INBOX_AGES = ((7, "7+ days"), (3, "3-6 days"), (1, "1-2 days"), (0, "under 1 day"))
+_AGE_SQL = "CASE " + " ".join(
+    f"WHEN julianday('now') - julianday(applied_at) >= {days} THEN '{label}'" for days, label in INBOX_AGES[:-1]
+) + f" ELSE '{INBOX_AGES[-1][1]}' END"
+
+
+def _last_inbox_change(cur):
+    # Highest change_id ever assigned, pruned or not.
+    row = cur.execute("SELECT seq FROM sqlite_sequence WHERE name='InboxChange'").fetchone()
+    return row[0] if row else 0
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def inbox_summary(dept_id):
+    # Pending counts by leave type and age from the materialized inbox, and
+    # the cursor to pass to inbox_changes() for what happens next.
+    with transaction(immediate=False) as cur:
+        counts = {}
+        for leave_type, age, count in cur.execute(
+                f"SELECT leave_type, {_AGE_SQL}, COUNT(*) FROM PendingInbox WHERE dept_id=? GROUP BY 1, 2",
+                (dept_id,)):
+            counts.setdefault(leave_type, {})[age] = count
+        cursor = _last_inbox_change(cur)
+    return {"total": sum(sum(ages.values()) for ages in counts.values()), "counts": counts, "cursor": cursor}
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def inbox_changes(dept_id, cursor=0, limit=500):
+    # Inbox changes after `cursor`, oldest first: (change_id, leave_id, change,
+    # row) where change is 'added' (row as in pending_leaves, or None if it
+    # has left again) or the status it left with. One index range scan.
+    # reset means changes after the cursor were pruned; reload pending_leaves().
+    with transaction(immediate=False) as cur:
+        oldest = cur.execute("SELECT MIN(change_id) FROM InboxChange").fetchone()[0]
+        floor = _last_inbox_change(cur) if oldest is None else oldest - 1
+        rows = cur.execute('''SELECT C.change_id, C.leave_id, C.change, I.leave_id, I.emp_code, E.name,
+                                      I.from_date, I.to_date, I.days, I.reason, I.leave_type
+                               FROM InboxChange C
+                               LEFT JOIN PendingInbox I ON C.change = 'added' AND I.leave_id = C.leave_id
+                               LEFT JOIN Person E ON E.emp_code = I.emp_code
+                               WHERE C.dept_id=? AND C.change_id > ?
+                               ORDER BY C.change_id LIMIT ?''', (dept_id, cursor, limit)).fetchall()
+    changes = [(row[0], row[1], row[2], row[3:] if row[3] is not None else None) for row in rows]
+    return {"changes": changes, "cursor": rows[-1][0] if rows else max(cursor, floor), "reset": cursor < floor}
+
+
+def prune_inbox_changes(keep_days=7):
+    # Run per shard by the daily status job.
+    with transaction() as cur:
+        cur.execute("DELETE FROM InboxChange WHERE created_at < datetime('now', ?)", (f"-{keep_days} days",))
+        return cur.rowcount
+
+
+def _summary_message(summary):
+    message = (f"{len(summary['approved'])} approved, {len(summary['rejected'])} rejected, "
+               f"{len(summary['skipped'])} skipped.")
+    if summary["no_balance"]:
+        message += f" {len(summary['no_balance'])} approved as LOP for lack of balance."
+    return message
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def decide_leaves(dept_id, decisions, actor=None):
+    # decisions: iterable of (leave_id, approve) pairs; a later entry for the same id wins.
+    # actor is recorded in the event log, e.g. the deciding head's emp_code.
+    # Only employees' leaves are decided here; heads' go to HR.
+    decisions = {int(leave_id): bool(approve) for leave_id, approve in decisions}
+    summary = {"approved": [], "rejected": [], "skipped": [], "no_balance": []}
+    if decisions:
+        try:
+            _apply_decisions(decisions, summary, actor, "employee", dept_id)
+        except ledger.BalanceConflict as e:
+            return Result(False, str(e))
+    return _decided(decisions, summary)
+
+
+def _decided(decisions, summary):
+    found = set(summary["approved"] + summary["rejected"])
+    summary["skipped"] = [leave_id for leave_id in decisions if leave_id not in found]
+    return Result(True, _summary_message(summary), summary)
+
+
+def _shard_head_leaves():
+    with connection() as conn:
+        return conn.execute('''SELECT L.leave_id, L.emp_code, E.name, E.dept_id, L.from_date, L.to_date, L.days,
+                                      L.reason, L.leave_type
+                               FROM Person E JOIN Leave L ON L.emp_code = E.emp_code
+                               WHERE E.role = 'head' AND L.status = 'pending' ORDER BY L.leave_id''').fetchall()
+
+
+@profiling.timed
+def head_pending_leaves():
+    # Pending requests from department heads, which HR decides.
+    return sorted(row for rows in db.fan_out(_shard_head_leaves).values() for row in rows)
+
+
+@profiling.timed
+def decide_head_leaves(decisions, actor=None):
+    # decide_leaves() for heads' requests, by HR; actor is the HR ID.
+    decisions = {int(leave_id): bool(approve) for leave_id, approve in decisions}
+    summary = {"approved": [], "rejected": [], "skipped": [], "no_balance": []}
+    by_shard = {}
+    for leave_id, approve in decisions.items():
+        by_shard.setdefault(db.shard_for_leave(leave_id), {})[leave_id] = approve
+    for shard, shard_decisions in by_shard.items():
+        try:
+            with db.use_shard(shard):
+                _apply_decisions(shard_decisions, summary, actor, "head")
+        except ledger.BalanceConflict as e:
+            return Result(False, str(e))
+    return _decided(decisions, summary)
+
+
+def _apply_decisions(decisions, summary, actor, role, dept_id=None):
+    sql = '''SELECT L.leave_id, L.emp_code, L.days, L.from_date, L.is_long_leave
+             FROM Leave L JOIN Person E ON L.emp_code = E.emp_code
+             WHERE L.leave_id IN (SELECT value FROM json_each(?))
+             AND L.status='pending' AND E.role=?'''
+    params = [json.dumps(list(decisions)), role]
+    if dept_id is not None:
+        sql += " AND E.dept_id=?"
+        params.append(dept_id)
+    with transaction() as cur:
+        rows = cur.execute(sql + " ORDER BY L.leave_id", params).fetchall()
+        emp_codes = json.dumps(sorted({row[1] for row in rows}))
+        versions = {row[0]: row[1:] for row in cur.execute(
+            "SELECT emp_code, leave_balance, balance_version FROM Person "
+            "WHERE emp_code IN (SELECT value FROM json_each(?))", (emp_codes,))}
+        balances = {emp_code: amount for emp_code, (amount, _) in versions.items()}
+
+        statuses = []
+        transitions = []
+        entries = []
+        usage = []
+        long_leaves = []
+        for leave_id, emp_code, days, from_date, is_long_leave in rows:
+            if not decisions[leave_id]:
+                statuses.append(('rejected', leave_id))
+                transitions.append((leave_id, emp_code, 'rejected', actor, None))
+                summary["rejected"].append(leave_id)
+                continue
+            statuses.append(('approved', leave_id))
+            summary["approved"].append(leave_id)
+            usage.append((emp_code, from_date[:7], days))
+            if is_long_leave:
+                long_leaves.append(emp_code)
+            if balances[emp_code] >= days:
+                balances[emp_code] -= days
+                entries.append((emp_code, leave_id, -days, 'approve'))
+                transitions.append((leave_id, emp_code, 'approved', actor, None))
+            else:
+                # Not enough balance: approve as loss of pay rather than silently
+                # skipping the deduction.
+                summary["no_balance"].append(leave_id)
+                transitions.append((leave_id, emp_code, 'approved', actor, {"is_lop": True}))
+
+        cur.executemany("UPDATE Leave SET status=? WHERE leave_id=?", statuses)
+        cur.executemany("UPDATE Leave SET is_lop=1 WHERE leave_id=?",
+                        [(leave_id,) for leave_id in summary["no_balance"]])
+        events.record(cur, transitions)
+        ledger.post_many(cur, entries, versions)
+        cur.executemany('''INSERT INTO LeaveUsage (emp_code, month, approved_days) VALUES (?, ?, ?)
+                           ON CONFLICT(emp_code, month) DO UPDATE SET approved_days = approved_days + excluded.approved_days''',
+                        usage)
+        # A long leave approved after its start date takes effect now rather
+        # than at the next daily status run.
+        if long_leaves:
+            lifecycle.refresh(cur, long_leaves)
+
+
+@_routed(db.shard_for_dept, "dept_id")
+def decide_leave(dept_id, leave_id, approve, actor=None):
+    result = decide_leaves(dept_id, [(leave_id, approve)], actor)
+    if not result.ok:
+        return result
+    if result.data["skipped"]:
+        return Result(False, "Invalid Leave ID or leave is not pending.")
+    return Result(True, "Leave approved." if approve else "Leave rejected.")
+
+
+@profiling.timed
+@_routed(db.shard_for_dept, "dept_id")
+def auto_approve(dept_id, leave_type='Casual', max_days=1, require_balance=True, actor=None):
+    # Rule-based bulk approval, e.g. every pending Casual leave of at most one day.
+    sql = '''SELECT L.leave_id
+             FROM PendingInbox L JOIN Person E ON L.emp_code = E.emp_code
+             WHERE L.dept_id=?'''
+    params = [dept_id]
+    if leave_type:
+        sql += " AND L.leave_type=?"
+        params.append(leave_type)
+    if max_days is not None:
+        sql += " AND L.days<=?"
+        params.append(max_days)
+    if require_balance:
+        sql += " AND E.leave_balance >= L.days"
+    with connection() as conn:
+        leave_ids = [row[0] for row in conn.execute(sql, params)]
+    return decide_leaves(dept_id, [(leave_id, True) for leave_id in leave_ids], actor)
+
+
+LEAVE_STATUSES = ('approved', 'cancelled', 'pending', 'rejected')
+
+LEAVE_LISTING_SQL = '''
+    SELECT L.leave_id, L.emp_code, E.name, E.department,
+           L.from_date, L.to_date, L.days, L.leave_type, L.status,
+           L.is_lop, L.is_long_leave,
+           CASE WHEN julianday(E.join_date) > julianday('now','-1 year')
+                THEN 'New' ELSE 'Experienced' END as experience
+    FROM AllLeaves L JOIN Person E ON L.emp_code = E.emp_code
+'''
+
+
+def _status_page(conn, status, key, limit, dept_id=None, emp_code=None, from_date=None, to_date=None):
+    where = ["L.status=?"]
+    params = [status]
+    if key:
+        # Keyset continuation within one status: (from_date, leave_id) descending.
+        where.append("(L.from_date, L.leave_id) < (?, ?)")
+        params += list(key)
+    if dept_id:
+        where.append("E.dept_id=?")
+        params.append(dept_id)
+    if emp_code:
+        where.append("L.emp_code=?")
+        params.append(emp_code)
+    if from_date:
+        where.append("L.to_date >= ?")
+        params.append(from_date)
+    if to_date:
+        where.append("L.from_date <= ?")
+        params.append(to_date)
+    params.append(limit)
+    return conn.execute(LEAVE_LISTING_SQL + " WHERE " + " AND ".join(where) +
+                        " ORDER BY L.from_date DESC, L.leave_id DESC LIMIT ?", params).fetchall()
+
+
+def _shard_page(after, limit, statuses, filters):
+    rows = []
+    with connection() as conn:
+        for current in statuses:
+            if after and current < after[0]:
+                continue
+            key = after[1:] if after and current == after[0] else None
+            rows += _status_page(conn, current, key, limit - len(rows), **filters)
+            if len(rows) == limit:
+                break
+    return rows
+
+
+@profiling.timed
+def leave_page(after=None, limit=100, status=None, **filters):
+    # Returns one page ordered by status, from_date DESC plus the cursor for the
+    # next page (None when exhausted). Each page is a separate short read; with
+    # several shards, each reads its own first `limit` rows in parallel and
+    # the page is the first `limit` of those in the same order.
+    statuses = [status] if status else LEAVE_STATUSES
+    if filters.get("emp_code"):
+        shards = [person_shard(filters["emp_code"])]
+    elif filters.get("dept_id"):
+        shards = [db.shard_for_dept(filters["dept_id"])]
+    else:
+        shards = db.shard_names()
+    if len(shards) == 1:
+        with db.use_shard(shards[0]):
+            rows = _shard_page(after, limit, statuses, filters)
+    else:
+        rows = [row for page in db.fan_out(_shard_page, after, limit, statuses, filters).values() for row in page]
+        rows.sort(key=lambda row: (row[4], row[0]), reverse=True)
+        rows.sort(key=lambda row: row[8])
+        del rows[limit:]
+    if len(rows) < limit:
+        return rows, None
+    last = rows[-1]
+    return rows, (last[8], last[4], last[0])
+
+
+def iter_leaves(batch_size=500, **filters):
+    after = None
+    while True:
+        rows, after = leave_page(after, batch_size, **filters)
+        yield from rows
+        if after is None:
+            return
@@ -0,0 +1,81 @@
+from db import connection, fan_out
+
+
+class BalanceConflict(Exception):
+    pass
+
+
+def balance(cur, emp_code):
+    # (leave_balance, balance_version) or None
+    return cur.execute("SELECT leave_balance, balance_version FROM Person WHERE emp_code=?", (emp_code,)).fetchone()
+
+
+def post(cur, emp_code, delta, reason, leave_id=None, expected_version=None):
+    # Applies one balance change and appends it to the ledger. Must run inside a
+    # write transaction; the version check catches writers that read the balance
+    # before taking the lock.
+    current = balance(cur, emp_code)
+    if current is None:
+        raise BalanceConflict(f"No balance account for {emp_code}.")
+    amount, version = current
+    if expected_version is not None and version != expected_version:
+        raise BalanceConflict(f"Balance of {emp_code} changed (version {version}, expected {expected_version}).")
+    cur.execute('''UPDATE Person SET leave_balance = leave_balance + ?, balance_version = balance_version + 1
+                   WHERE emp_code=? AND balance_version=?''', (delta, emp_code, version))
+    if cur.rowcount != 1:
+        raise BalanceConflict(f"Balance of {emp_code} changed concurrently.")
+    cur.execute('''INSERT INTO BalanceLedger (emp_code, leave_id, delta, reason, balance_after, version)
+                   VALUES (?, ?, ?, ?, ?, ?)''', (emp_code, leave_id, delta, reason, amount + delta, version + 1))
+    return amount + delta
+
+
+def post_many(cur, entries, versions):
+    # entries: (emp_code, leave_id, delta, reason) in application order.
+    # versions: {emp_code: (balance, version)} read in the same transaction.
+    rows = []
+    updates = {}
+    for emp_code, leave_id, delta, reason in entries:
+        amount, version = updates.get(emp_code, versions[emp_code])
+        amount, version = amount + delta, version + 1
+        updates[emp_code] = (amount, version)
+        rows.append((emp_code, leave_id, delta, reason, amount, version))
+    cur.executemany('''UPDATE Person SET leave_balance=?, balance_version=?
+                       WHERE emp_code=? AND balance_version=?''',
+                    [(amount, version, emp_code, versions[emp_code][1])
+                     for emp_code, (amount, version) in updates.items()])
+    if cur.rowcount != len(updates):
+        raise BalanceConflict("Balances changed concurrently.")
+    cur.executemany('''INSERT INTO BalanceLedger (emp_code, leave_id, delta, reason, balance_after, version)
+                       VALUES (?, ?, ?, ?, ?, ?)''', rows)
+
+
+def open_accounts(cur, emp_codes=None):
+    # Opening entries matching the current balance for accounts with no history.
+    sql = '''INSERT INTO BalanceLedger (emp_code, delta, reason, balance_after, version)
+             SELECT P.emp_code, P.leave_balance, 'opening', P.leave_balance, P.balance_version
+             FROM Person P
+             WHERE NOT EXISTS (SELECT 1 FROM BalanceLedger B WHERE B.emp_code = P.emp_code)'''
+    if emp_codes is None:
+        cur.execute(sql)
+    else:
+        cur.executemany(sql + " AND P.emp_code=?", [(emp_code,) for emp_code in emp_codes])
+
+
+def charged_for_leave(cur, leave_id):
+    # Net days taken from the balance for this leave (positive = deducted).
+    row = cur.execute("SELECT COUNT(*), -COALESCE(SUM(delta), 0) FROM BalanceLedger WHERE leave_id=?",
+                      (leave_id,)).fetchone()
+    return row[1] if row[0] else None
+
+
+def mismatches():
+    # Accounts whose materialized balance disagrees with the ledger, in every shard.
+    return [row for rows in fan_out(_shard_mismatches).values() for row in rows]
+
+
+def _shard_mismatches():
+    with connection() as conn:
+        return conn.execute('''SELECT P.emp_code, P.leave_balance, SUM(B.delta)
+                               FROM Person P JOIN BalanceLedger B ON B.emp_code = P.emp_code
+                               GROUP BY P.emp_code
+                               HAVING P.leave_balance != SUM(B.delta)''').fetchall()
@@ -0,0 +1,68 @@
+import datetime
+import json
+
+import profiling
+from db import transaction
+
+JOB = "live_status"
+
+# 'relieved' once relieved, 'longleave' while an approved long leave covers the
+# day, else 'live'. Active (pending/approved) leaves never overlap, so only the
+# latest one starting on or before the day can cover it: one probe of
+# idx_leave_active_emp_from.
+STATUS_SQL = '''
+    CASE WHEN Person.relieve_date IS NOT NULL THEN 'relieved'
+         WHEN (SELECT L.status = 'approved' AND L.is_long_leave AND L.to_date >= :day
+               FROM Leave L
+               WHERE L.emp_code = Person.emp_code AND L.status IN ('pending','approved') AND L.from_date <= :day
+               ORDER BY L.from_date DESC LIMIT 1)
+         THEN 'longleave' ELSE 'live' END'''
+
+
+def refresh(cur, emp_codes, today=None):
+    # Re-derives live_status for these people as of today; only rows whose
+    # status actually changes are written.
+    day = (today or datetime.date.today()).isoformat()
+    cur.execute(f'''UPDATE Person SET live_status = {STATUS_SQL}
+                    WHERE emp_code IN (SELECT value FROM json_each(:emp_codes))
+                      AND live_status IS NOT {STATUS_SQL}''',
+                {"day": day, "emp_codes": json.dumps(sorted(set(emp_codes)))})
+    return cur.rowcount
+
+
+def refresh_all(cur, today=None):
+    day = (today or datetime.date.today()).isoformat()
+    cur.execute(f"UPDATE Person SET live_status = {STATUS_SQL} WHERE live_status IS NOT {STATUS_SQL}", {"day": day})
+    return cur.rowcount
+
+
+def _last_run(cur):
+    row = cur.execute("SELECT value FROM JobState WHERE job=?", (JOB,)).fetchone()
+    return datetime.date.fromisoformat(row[0]) if row else None
+
+
+@profiling.timed
+def run_daily(today=None):
+    # Only people whose approved long leave started after the last run (up to
+    # today) or whose last day fell between the last run and yesterday can
+    # have changed. The first run, or a run after the clock moved back,
+    # re-derives everyone.
+    today = today or datetime.date.today()
+    with transaction() as cur:
+        last = _last_run(cur)
+        if last is None or last > today:
+            changed = refresh_all(cur, today)
+        elif last == today:
+            changed = 0
+        else:
+            emp_codes = [row[0] for row in cur.execute(
+                '''SELECT emp_code FROM Leave
+                   WHERE status='approved' AND is_long_leave AND from_date > ? AND from_date <= ?
+                   UNION
+                   SELECT emp_code FROM Leave
+                   WHERE status='approved' AND is_long_leave AND to_date >= ? AND to_date < ?''',
+                (last.isoformat(), today.isoformat(), last.isoformat(), today.isoformat()))]
+            changed = refresh(cur, emp_codes, today) if emp_codes else 0
+        cur.execute('''INSERT INTO JobState (job, value) VALUES (?, ?)
+                       ON CONFLICT(job) DO UPDATE SET value = excluded.value''', (JOB, today.isoformat()))
+    return changed
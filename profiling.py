@@ -0,0 +1,325 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Off unless LEAVE_MGMT_PROFILE is set or enable() is called before the first
+# connection is opened; when off, connections are plain sqlite3 ones and
+# timed() costs one flag check per call.
+ENABLED = os.environ.get("LEAVE_MGMT_PROFILE", "") not in ("", "0")
+SLOW_SECONDS = float(os.environ.get("LEAVE_MGMT_SLOW_MS", "50")) / 1000
+# Upper bounds in seconds; finer at the low end than Prometheus' defaults,
+# since most statements here are sub-millisecond index probes.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_STATEMENTS = 1000
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.seconds += seconds
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Statement:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.latency = Histogram()   # execute() only
+        self.seconds = 0.0           # execute() plus fetching
+        self.rows = 0
+        self.plan = None
+
+
+class _Operation:
+    def __init__(self):
+        self.latency = Histogram()
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.errors = 0
+
+
+_statements = {}
+_operations = {}
+_fingerprints = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _operations.clear()
+
+
+def fingerprint(sql):
+    # Literals become ?, IN lists of any length collapse, whitespace is folded.
+    text = _fingerprints.get(sql)
+    if text is None:
+        text = _IN_LISTS.sub("(?+)", _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip())
+        if len(_fingerprints) >= MAX_STATEMENTS:
+            _fingerprints.clear()
+        _fingerprints[sql] = text
+    return text
+
+
+def _statement(sql):
+    key = fingerprint(sql)
+    statement = _statements.get(key)
+    if statement is None:
+        with _lock:
+            if len(_statements) >= MAX_STATEMENTS:
+                key = "(other)"
+            statement = _statements.setdefault(key, _Statement(key))
+    return statement
+
+
+def _explain(conn, sql, parameters):
+    try:
+        return [row[-1] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+
+def _charge(seconds, statements=0):
+    for operation in getattr(_local, "operations", ()):
+        operation.db_seconds += seconds
+        operation.statements += statements
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _current = None
+
+    def _run(self, method, sql, parameters, single):
+        statement = _statement(sql)
+        self._current = statement
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                statement.latency.observe(elapsed)
+                statement.seconds += elapsed
+                statement.rows += max(self.rowcount, 0)
+            _charge(elapsed, 1)
+            if (single and elapsed >= SLOW_SECONDS and statement.plan is None
+                    and sql.lstrip()[:7].upper().startswith(EXPLAINABLE)):
+                statement.plan = _explain(self.connection, sql, parameters)
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, False)
+
+    def _fetched(self, start, rows):
+        elapsed = time.perf_counter() - start
+        statement = self._current
+        if statement is not None:
+            with _lock:
+                statement.seconds += elapsed
+                statement.rows += rows
+        _charge(elapsed)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0)
+            raise
+        self._fetched(start, 1)
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    # sqlite3.Connection.execute() doesn't go through cursor(), so both are
+    # routed to ProfiledCursor here.
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        statement = _statement("COMMIT")
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                statement.latency.observe(elapsed)
+                statement.seconds += elapsed
+            _charge(elapsed, 1)
+
+
+def connection_factory():
+    return ProfiledConnection if ENABLED else sqlite3.Connection
+
+
+@contextmanager
+def operation(name):
+    # Times a block as `name`; statements run inside it are charged to it
+    # and to any operation it is nested in.
+    record = _Operation()
+    stack = _local.__dict__.setdefault("operations", [])
+    stack.append(record)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            total = _operations.setdefault(name, _Operation())
+            total.latency.observe(elapsed)
+            total.db_seconds += record.db_seconds
+            total.statements += record.statements
+            total.errors += failed
+
+
+def timed(func):
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return func(*args, **kwargs)
+        with operation(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def snapshot():
+    with _lock:
+        operations = {name: {"calls": op.latency.count, "seconds": round(op.latency.seconds, 6),
+                             "p50": op.latency.quantile(0.5), "p99": op.latency.quantile(0.99),
+                             "db_seconds": round(op.db_seconds, 6), "statements": op.statements,
+                             "errors": op.errors, "buckets": list(op.latency.buckets)}
+                      for name, op in _operations.items()}
+        statements = [{"sql": s.fingerprint, "calls": s.latency.count, "seconds": round(s.seconds, 6),
+                       "p99": s.latency.quantile(0.99), "rows": s.rows, "plan": s.plan}
+                      for s in _statements.values()]
+    statements.sort(key=lambda s: s["seconds"], reverse=True)
+    return {"operations": operations, "statements": statements}
+
+
+def report(limit=15):
+    # Plain-text dump: operations by total time, then the costliest statements.
+    stats = snapshot()
+    lines = ["{:<24} {:>7} {:>10} {:>8} {:>8} {:>10} {:>6}".format(
+        "Operation", "Calls", "Seconds", "p50", "p99", "DB secs", "Stmts")]
+    for name, op in sorted(stats["operations"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+        lines.append("{:<24} {:>7} {:>10.3f} {:>8} {:>8} {:>10.3f} {:>6}".format(
+            name, op["calls"], op["seconds"], _bound(op["p50"]), _bound(op["p99"]), op["db_seconds"],
+            op["statements"]))
+    lines.append("")
+    lines.append("{:>7} {:>10} {:>8} {:>9}  {}".format("Calls", "Seconds", "p99", "Rows", "Statement"))
+    for statement in stats["statements"][:limit]:
+        lines.append("{:>7} {:>10.3f} {:>8} {:>9}  {}".format(
+            statement["calls"], statement["seconds"], _bound(statement["p99"]), statement["rows"],
+            statement["sql"][:120]))
+        for step in statement["plan"] or ():
+            lines.append(f"{'':>38}  plan: {step}")
+    return "\n".join(lines)
+
+
+def _bound(seconds):
+    return "inf" if seconds == float("inf") else f"<{seconds * 1000:g}ms"
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text():
+    # Prometheus text exposition format 0.0.4.
+    with _lock:
+        operations = {name: (list(op.latency.buckets), op.latency.count, op.latency.seconds, op.db_seconds,
+                             op.statements, op.errors) for name, op in _operations.items()}
+        statements = [(s.fingerprint, s.latency.count, s.seconds, s.rows) for s in _statements.values()]
+    lines = ["# HELP leave_mgmt_operation_seconds Service operation latency.",
+             "# TYPE leave_mgmt_operation_seconds histogram"]
+    for name, (buckets, count, seconds, _, _, _) in sorted(operations.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'leave_mgmt_operation_seconds_bucket{{operation="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'leave_mgmt_operation_seconds_sum{{operation="{name}"}} {seconds}')
+        lines.append(f'leave_mgmt_operation_seconds_count{{operation="{name}"}} {count}')
+    for metric, index, help_text in (("operation_db_seconds_total", 3, "Time spent in SQLite per operation."),
+                                     ("operation_statements_total", 4, "SQL statements run per operation."),
+                                     ("operation_errors_total", 5, "Operations that raised.")):
+        lines.append(f"# HELP leave_mgmt_{metric} {help_text}")
+        lines.append(f"# TYPE leave_mgmt_{metric} counter")
+        for name, values in sorted(operations.items()):
+            lines.append(f'leave_mgmt_{metric}{{operation="{name}"}} {values[index]}')
+    for metric, index, help_text in (("statement_calls_total", 1, "Executions per SQL fingerprint."),
+                                     ("statement_seconds_total", 2, "Execute and fetch time per SQL fingerprint."),
+                                     ("statement_rows_total", 3, "Rows fetched or changed per SQL fingerprint.")):
+        lines.append(f"# HELP leave_mgmt_{metric} {help_text}")
+        lines.append(f"# TYPE leave_mgmt_{metric} counter")
+        for values in statements:
+            lines.append(f'leave_mgmt_{metric}{{statement="{_label(values[0])}"}} {values[index]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,481 @@
+import events
+import ledger
+import lifecycle
+from db import first_leave_id, shard_names, transaction
+
+
+def _create_base_tables(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS HR (
+        hr_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        designation TEXT NOT NULL,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Department (
+        dept_id TEXT PRIMARY KEY,
+        dept_name TEXT NOT NULL,
+        head_emp_code TEXT
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Head (
+        emp_code TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        department TEXT NOT NULL,
+        designation TEXT NOT NULL,
+        post TEXT NOT NULL,
+        dept_id TEXT NOT NULL,
+        join_date TEXT NOT NULL,
+        relieve_date TEXT,
+        leave_balance INTEGER NOT NULL,
+        live_status TEXT DEFAULT 'live',
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_by_hr TEXT NOT NULL,
+        FOREIGN KEY (dept_id) REFERENCES Department(dept_id)
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Employee (
+        emp_code TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        department TEXT NOT NULL,
+        designation TEXT NOT NULL,
+        post TEXT NOT NULL,
+        dept_id TEXT NOT NULL,
+        join_date TEXT NOT NULL,
+        relieve_date TEXT,
+        leave_balance INTEGER NOT NULL,
+        live_status TEXT DEFAULT 'live',
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_by_hr TEXT NOT NULL,
+        FOREIGN KEY (dept_id) REFERENCES Department(dept_id)
+    )''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Leave (
+        leave_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_code TEXT,
+        from_date TEXT,
+        to_date TEXT,
+        days INTEGER,
+        reason TEXT,
+        leave_type TEXT,
+        status TEXT CHECK(status IN ('pending','approved','rejected','cancelled')) DEFAULT 'pending',
+        is_lop BOOLEAN,
+        is_long_leave BOOLEAN,
+        FOREIGN KEY (emp_code) REFERENCES Employee(emp_code)
+    )''')
+
+
+def _add_query_indexes(cur):
+    # cancel_leave / view_leave_status: Leave by emp_code and status
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leave_emp_status ON Leave(emp_code, status)")
+    # process_head_leaves: only pending rows, reached through the employee's department
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leave_pending_emp ON Leave(emp_code) WHERE status='pending'")
+    # apply_leave monthly quota: covers the SUM(days) without touching the table
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_leave_approved_emp_from
+                   ON Leave(emp_code, from_date, days) WHERE status='approved'""")
+    # view_all_leaves_hr ordering
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leave_status_from ON Leave(status, from_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employee_dept ON Employee(dept_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_head_dept ON Head(dept_id)")
+    # Give the planner statistics so it can choose between the overlapping indexes.
+    cur.execute("ANALYZE")
+
+
+def _add_leave_usage(cur):
+    # Approved days per employee per calendar month ('YYYY-MM' of from_date),
+    # kept up to date by the service layer on approve and cancel.
+    cur.execute('''CREATE TABLE IF NOT EXISTS LeaveUsage (
+        emp_code TEXT NOT NULL,
+        month TEXT NOT NULL,
+        approved_days INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (emp_code, month)
+    ) WITHOUT ROWID''')
+    rebuild_leave_usage(cur)
+
+
+def rebuild_leave_usage(cur):
+    cur.execute("DELETE FROM LeaveUsage")
+    cur.execute('''INSERT INTO LeaveUsage (emp_code, month, approved_days)
+                   SELECT emp_code, substr(from_date, 1, 7), SUM(days)
+                   FROM Leave
+                   WHERE status='approved'
+                   GROUP BY emp_code, substr(from_date, 1, 7)''')
+
+
+PERSON_COLUMNS = ("emp_code", "name", "department", "designation", "post", "dept_id", "join_date", "relieve_date",
+                  "leave_balance", "live_status", "username", "password", "created_by_hr")
+PERSON_VIEWS = {"Employee": "employee", "Head": "head"}
+PERSON_INSERT = (f"INSERT INTO Person ({', '.join(PERSON_COLUMNS)}, role) "
+                 f"VALUES ({', '.join('?' * (len(PERSON_COLUMNS) + 1))})")
+
+
+def _unify_people(cur):
+    # Employee and Head had identical columns; keep one Person table with a role
+    # and expose the old tables as views (same column order) with write triggers.
+    cur.execute('''CREATE TABLE IF NOT EXISTS Person (
+        emp_code TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        department TEXT NOT NULL,
+        designation TEXT NOT NULL,
+        post TEXT NOT NULL,
+        dept_id TEXT NOT NULL,
+        join_date TEXT NOT NULL,
+        relieve_date TEXT,
+        leave_balance INTEGER NOT NULL,
+        live_status TEXT DEFAULT 'live',
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_by_hr TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'employee' CHECK(role IN ('employee','head')),
+        FOREIGN KEY (dept_id) REFERENCES Department(dept_id)
+    )''')
+    columns = ", ".join(PERSON_COLUMNS)
+    cur.execute(f"INSERT OR IGNORE INTO Person ({columns}, role) SELECT {columns}, 'employee' FROM Employee")
+    cur.execute(f"INSERT OR REPLACE INTO Person ({columns}, role) SELECT {columns}, 'head' FROM Head")
+    cur.execute("DROP TABLE Employee")
+    cur.execute("DROP TABLE Head")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_person_dept_role ON Person(dept_id, role)")
+
+    new_values = ", ".join(f"NEW.{column}" for column in PERSON_COLUMNS).replace(
+        "NEW.live_status", "COALESCE(NEW.live_status, 'live')")
+    assignments = ", ".join(f"{column}=NEW.{column}" for column in PERSON_COLUMNS)
+    for view, role in PERSON_VIEWS.items():
+        cur.execute(f"CREATE VIEW {view} AS SELECT {columns} FROM Person WHERE role='{role}'")
+        cur.execute(f'''CREATE TRIGGER {view}_insert INSTEAD OF INSERT ON {view} BEGIN
+                           INSERT INTO Person ({columns}, role) VALUES ({new_values}, '{role}');
+                       END''')
+        cur.execute(f'''CREATE TRIGGER {view}_update INSTEAD OF UPDATE ON {view} BEGIN
+                           UPDATE Person SET {assignments} WHERE emp_code=OLD.emp_code;
+                       END''')
+        cur.execute(f'''CREATE TRIGGER {view}_delete INSTEAD OF DELETE ON {view} BEGIN
+                           DELETE FROM Person WHERE emp_code=OLD.emp_code;
+                       END''')
+    cur.execute("ANALYZE Person")
+
+
+def _add_balance_ledger(cur):
+    # Person.leave_balance stays the materialized balance; every change to it is
+    # appended here, and balance_version guards against lost updates.
+    cur.execute("ALTER TABLE Person ADD COLUMN balance_version INTEGER NOT NULL DEFAULT 0")
+    cur.execute('''CREATE TABLE IF NOT EXISTS BalanceLedger (
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_code TEXT NOT NULL,
+        leave_id INTEGER,
+        delta INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        balance_after INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (emp_code, version)
+    )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ledger_leave ON BalanceLedger(leave_id) WHERE leave_id IS NOT NULL")
+    ledger.open_accounts(cur)
+
+
+# Person columns the leave report's chunk aggregates read.
+PERSON_REPORT_COLUMNS = ("dept_id", "join_date")
+# Leave changes are counted per block of 2**LEAVE_CHUNK_BITS leave_ids, so
+# derived data can be refreshed for the blocks that changed only.
+LEAVE_CHUNK_BITS = 16
+
+
+def _add_change_counters(cur):
+    # Bumped by triggers in the writer's own transaction, so readers can tell
+    # whether anything derived from these tables is still current.
+    cur.execute('''CREATE TABLE IF NOT EXISTS ChangeCounter (
+        name TEXT PRIMARY KEY,
+        counter INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    cur.execute("INSERT OR IGNORE INTO ChangeCounter (name) VALUES ('Person')")
+    cur.execute(f'''INSERT OR IGNORE INTO ChangeCounter (name)
+                    SELECT DISTINCT 'Leave/' || (leave_id >> {LEAVE_CHUNK_BITS}) FROM Leave''')
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cur.execute(f'''CREATE TRIGGER IF NOT EXISTS leave_{event.lower()}_counter AFTER {event} ON Leave BEGIN
+                           INSERT INTO ChangeCounter (name, counter)
+                           VALUES ('Leave/' || ({row}.leave_id >> {LEAVE_CHUNK_BITS}), 1)
+                           ON CONFLICT(name) DO UPDATE SET counter = counter + 1;
+                       END''')
+    for event in ("INSERT", f"UPDATE OF {', '.join(PERSON_REPORT_COLUMNS)}", "DELETE"):
+        cur.execute(f'''CREATE TRIGGER IF NOT EXISTS person_{event.split()[0].lower()}_counter
+                       AFTER {event} ON Person BEGIN
+                           UPDATE ChangeCounter SET counter = counter + 1 WHERE name='Person';
+                       END''')
+
+
+def change_counters(cur, prefix=""):
+    return dict(cur.execute("SELECT name, counter FROM ChangeCounter WHERE name GLOB ?", (prefix + "*",)))
+
+
+def _add_active_leave_index(cur):
+    # apply_leave overlap check: an employee's pending/approved leaves by
+    # start date, with to_date in the index so the range test is covered.
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_leave_active_emp_from
+                   ON Leave(emp_code, from_date, to_date) WHERE status IN ('pending','approved')""")
+
+
+def _add_work_calendar(cur):
+    # Holidays and weekly offs, company-wide (scope '*') or per department
+    # (scope = dept_id). A department's WorkWeek row replaces the '*' one;
+    # its holidays are added to the company-wide ones.
+    cur.execute('''CREATE TABLE IF NOT EXISTS Holiday (
+        scope TEXT NOT NULL DEFAULT '*',
+        holiday_date TEXT NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (scope, holiday_date)
+    ) WITHOUT ROWID''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS WorkWeek (
+        scope TEXT PRIMARY KEY,
+        weekly_offs TEXT NOT NULL
+    ) WITHOUT ROWID''')
+    # Comma-separated weekdays, Monday = 0.
+    cur.execute("INSERT OR IGNORE INTO WorkWeek VALUES ('*', '5,6')")
+    cur.execute("INSERT OR IGNORE INTO ChangeCounter (name) VALUES ('Calendar')")
+    for table in ("Holiday", "WorkWeek"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f'''CREATE TRIGGER IF NOT EXISTS {table.lower()}_{event.lower()}_counter
+                           AFTER {event} ON {table} BEGIN
+                               UPDATE ChangeCounter SET counter = counter + 1 WHERE name='Calendar';
+                           END''')
+
+
+def _add_accrual_index(cur):
+    # Each period entry of the accrual job can be posted once per person, so
+    # re-running or resuming the job never grants twice.
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_period_once ON BalanceLedger(emp_code, reason)
+                   WHERE reason GLOB 'annual_grant:*' OR reason GLOB 'carry_forward_cap:*' OR reason = 'anniversary'""")
+
+
+def _add_status_lifecycle(cur):
+    # live_status is derived from approved long leaves by lifecycle.run_daily();
+    # these indexes find the leaves starting or ending in the days it covers.
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_leave_long_from ON Leave(from_date)
+                   WHERE status='approved' AND is_long_leave""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_leave_long_to ON Leave(to_date)
+                   WHERE status='approved' AND is_long_leave""")
+    cur.execute('''CREATE TABLE IF NOT EXISTS JobState (
+        job TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID''')
+    # Status as of today without waiting for the daily job.
+    status = lifecycle.STATUS_SQL.replace(":day", "date('now', 'localtime')")
+    cur.execute(f"CREATE VIEW IF NOT EXISTS CurrentStatus AS SELECT emp_code, {status} AS live_status FROM Person")
+    # Clear 'longleave' flags set at apply time that were never reset.
+    lifecycle.refresh_all(cur)
+
+
+def _add_event_log(cur):
+    # Every Leave transition is appended here by the service in the same
+    # transaction; events.py replays it. Existing leaves get an 'opening' event
+    # with their current state, as balances got an opening ledger entry.
+    cur.execute('''CREATE TABLE IF NOT EXISTS LeaveEvent (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        leave_id INTEGER NOT NULL,
+        emp_code TEXT NOT NULL,
+        event TEXT NOT NULL,
+        actor TEXT,
+        data TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_event_leave ON LeaveEvent(leave_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_event_emp ON LeaveEvent(emp_code, event_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_event_created ON LeaveEvent(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ledger_created ON BalanceLedger(created_at)")
+    for event in ("UPDATE", "DELETE"):
+        cur.execute(f'''CREATE TRIGGER IF NOT EXISTS leave_event_no_{event.lower()} BEFORE {event} ON LeaveEvent BEGIN
+                           SELECT RAISE(ABORT, 'LeaveEvent is append-only');
+                       END''')
+    events.open_leaves(cur)
+
+    # Replay state at EventCheckpoint.event_id / entry_id, so replay starts
+    # from the latest checkpoint rather than the first event.
+    cur.execute('''CREATE TABLE IF NOT EXISTS EventCheckpoint (
+        checkpoint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER NOT NULL,
+        entry_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS CheckpointLeave (
+        checkpoint_id INTEGER NOT NULL,
+        leave_id INTEGER NOT NULL,
+        emp_code TEXT,
+        from_date TEXT,
+        to_date TEXT,
+        days INTEGER,
+        reason TEXT,
+        leave_type TEXT,
+        status TEXT,
+        is_lop BOOLEAN,
+        is_long_leave BOOLEAN,
+        PRIMARY KEY (checkpoint_id, leave_id)
+    ) WITHOUT ROWID''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_checkpoint_leave_emp ON CheckpointLeave(checkpoint_id, emp_code)")
+    cur.execute('''CREATE TABLE IF NOT EXISTS CheckpointBalance (
+        checkpoint_id INTEGER NOT NULL,
+        emp_code TEXT NOT NULL,
+        balance INTEGER NOT NULL,
+        PRIMARY KEY (checkpoint_id, emp_code)
+    ) WITHOUT ROWID''')
+
+
+def _add_soft_delete(cur):
+    # People are relieved instead of deleted; CurrentStatus learns 'relieved'.
+    cur.execute("DROP VIEW IF EXISTS CurrentStatus")
+    status = lifecycle.STATUS_SQL.replace(":day", "date('now', 'localtime')")
+    cur.execute(f"CREATE VIEW CurrentStatus AS SELECT emp_code, {status} AS live_status FROM Person")
+    cur.execute("UPDATE Person SET live_status='relieved' WHERE relieve_date IS NOT NULL")
+
+
+def _add_submission_receipts(cur):
+    # Written with the leave by the submission queue (submissions.py), so a
+    # batch committed just before a crash isn't applied twice when the spool
+    # replays it.
+    cur.execute('''CREATE TABLE IF NOT EXISTS SubmissionReceipt (
+        receipt TEXT PRIMARY KEY,
+        leave_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID''')
+
+
+def _add_pending_inbox(cur):
+    # Each department's pending requests, kept by triggers in the writer's
+    # transaction, plus a change feed heads can poll from a cursor. dept_id
+    # is copied from Person when the leave is applied.
+    cur.execute('''CREATE TABLE IF NOT EXISTS PendingInbox (
+        leave_id INTEGER PRIMARY KEY,
+        dept_id TEXT NOT NULL,
+        emp_code TEXT NOT NULL,
+        from_date TEXT,
+        to_date TEXT,
+        days INTEGER,
+        reason TEXT,
+        leave_type TEXT,
+        applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inbox_dept ON PendingInbox(dept_id, leave_type, applied_at)")
+    # change: 'added', or the status the leave left the inbox with.
+    cur.execute('''CREATE TABLE IF NOT EXISTS InboxChange (
+        change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dept_id TEXT NOT NULL,
+        leave_id INTEGER NOT NULL,
+        change TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inbox_change_dept ON InboxChange(dept_id, change_id)")
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS inbox_leave_insert AFTER INSERT ON Leave
+                   WHEN NEW.status = 'pending' BEGIN
+                       INSERT INTO PendingInbox (leave_id, dept_id, emp_code, from_date, to_date, days, reason,
+                                                 leave_type)
+                       SELECT NEW.leave_id, dept_id, NEW.emp_code, NEW.from_date, NEW.to_date, NEW.days, NEW.reason,
+                              NEW.leave_type
+                       FROM Person WHERE emp_code = NEW.emp_code;
+                       INSERT INTO InboxChange (dept_id, leave_id, change)
+                       SELECT dept_id, leave_id, 'added' FROM PendingInbox WHERE leave_id = NEW.leave_id;
+                   END''')
+    for event, condition, change in (("UPDATE OF status", "NEW.status != 'pending'", "NEW.status"),
+                                     ("DELETE", "1", "'deleted'")):
+        cur.execute(f'''CREATE TRIGGER IF NOT EXISTS inbox_leave_{event.split()[0].lower()} AFTER {event} ON Leave
+                        WHEN OLD.status = 'pending' AND {condition} BEGIN
+                            INSERT INTO InboxChange (dept_id, leave_id, change)
+                            SELECT dept_id, leave_id, {change} FROM PendingInbox WHERE leave_id = OLD.leave_id;
+                            DELETE FROM PendingInbox WHERE leave_id = OLD.leave_id;
+                        END''')
+    # Existing requests count from when they were logged.
+    cur.execute("""INSERT OR IGNORE INTO PendingInbox (leave_id, dept_id, emp_code, from_date, to_date, days, reason,
+                                                    leave_type, applied_at)
+                   SELECT L.leave_id, P.dept_id, L.emp_code, L.from_date, L.to_date, L.days, L.reason, L.leave_type,
+                          COALESCE((SELECT MIN(created_at) FROM LeaveEvent E WHERE E.leave_id = L.leave_id),
+                                   CURRENT_TIMESTAMP)
+                   FROM Leave L JOIN Person P ON P.emp_code = L.emp_code
+                   WHERE L.status = 'pending'""")
+
+
+def _drop_quota_index(cur):
+    # The monthly quota is read from LeaveUsage now; nothing reads this
+    # index any more, but every approval still had to maintain it.
+    cur.execute("DROP INDEX IF EXISTS idx_leave_approved_emp_from")
+
+
+def _route_head_leaves_to_hr(cur):
+    # Heads' requests are decided by HR, so they stay out of their
+    # department's inbox; anything already there leaves the feed as 'rerouted'.
+    cur.execute("DROP TRIGGER IF EXISTS inbox_leave_insert")
+    cur.execute('''CREATE TRIGGER inbox_leave_insert AFTER INSERT ON Leave
+                   WHEN NEW.status = 'pending' BEGIN
+                       INSERT INTO PendingInbox (leave_id, dept_id, emp_code, from_date, to_date, days, reason,
+                                                 leave_type)
+                       SELECT NEW.leave_id, dept_id, NEW.emp_code, NEW.from_date, NEW.to_date, NEW.days, NEW.reason,
+                              NEW.leave_type
+                       FROM Person WHERE emp_code = NEW.emp_code AND role = 'employee';
+                       INSERT INTO InboxChange (dept_id, leave_id, change)
+                       SELECT dept_id, leave_id, 'added' FROM PendingInbox WHERE leave_id = NEW.leave_id;
+                   END''')
+    heads = "SELECT emp_code FROM Person WHERE role = 'head'"
+    cur.execute(f'''INSERT INTO InboxChange (dept_id, leave_id, change)
+                    SELECT dept_id, leave_id, 'rerouted' FROM PendingInbox WHERE emp_code IN ({heads})
+                    ORDER BY leave_id''')
+    cur.execute(f"DELETE FROM PendingInbox WHERE emp_code IN ({heads})")
+
+
+def _narrow_person_counter(cur):
+    # New hires have no leaves yet and role / relieve_date don't feed the
+    # report's aggregates, so only moves and join date fixes bump the counter.
+    cur.execute("DROP TRIGGER IF EXISTS person_insert_counter")
+    cur.execute("DROP TRIGGER IF EXISTS person_update_counter")
+    cur.execute(f'''CREATE TRIGGER person_update_counter
+                    AFTER UPDATE OF {', '.join(PERSON_REPORT_COLUMNS)} ON Person
+                    WHEN NEW.dept_id IS NOT OLD.dept_id OR NEW.join_date IS NOT OLD.join_date BEGIN
+                        UPDATE ChangeCounter SET counter = counter + 1 WHERE name='Person';
+                    END''')
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    _add_query_indexes,
+    _add_leave_usage,
+    _unify_people,
+    _add_balance_ledger,
+    _add_change_counters,
+    _add_active_leave_index,
+    _add_work_calendar,
+    _add_accrual_index,
+    _add_status_lifecycle,
+    _add_event_log,
+    _add_soft_delete,
+    _add_submission_receipts,
+    _add_pending_inbox,
+    _drop_quota_index,
+    _route_head_leaves_to_hr,
+    _narrow_person_counter,
+]
+
+
+def schema_version(cur):
+    return cur.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(cur):
+    version = schema_version(cur)
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(cur)
+        cur.execute(f"PRAGMA user_version={number}")
+
+
+def create_tables():
+    # Every shard carries the full schema, HR table included; HR accounts are
+    # only written to the default shard.
+    for shard in shard_names():
+        with transaction(shard=shard) as cur:
+            _create_base_tables(cur)
+            migrate(cur)
+            _reserve_leave_ids(cur, first_leave_id(shard))
+
+
+def _reserve_leave_ids(cur, first):
+    # Starts this shard's AUTOINCREMENT leave IDs at its block; see db.py.
+    if first:
+        cur.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'Leave', 0 "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name='Leave')")
+        cur.execute("UPDATE sqlite_sequence SET seq=? WHERE name='Leave' AND seq < ?", (first - 1, first - 1))
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import analytics
+import auth
+import db
+import events
+import leave_service as service
+import profiling
+import submissions
+
+MAX_BODY = 1024 * 1024
+READ_WORKERS = 8
+AUTH_WORKERS = 4
+SUBMIT_WORKERS = 4
+# Long polls on the inbox wake on this process's writes at once and re-check
+# every WATCH_POLL_SECONDS for writes made by other processes.
+MAX_WATCH_SECONDS = 60.0
+WATCH_POLL_SECONDS = 2.0
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _result(result):
+    return 200 if result.ok else 409, {"ok": result.ok, "message": result.message, "data": result.data}
+
+
+def _dept_id(session):
+    return service.employee_profile(session[1]).dept_id
+
+
+def _require(body, *keys):
+    missing = [key for key in keys if not isinstance(body.get(key), str)]
+    if missing:
+        raise HttpError(400, f"Missing fields: {', '.join(missing)}")
+    return [body[key] for key in keys]
+
+
+def login(session, match, query, body):
+    role, username, password = _require(body, "role", "username", "password")
+    if role not in auth.ROLES:
+        raise HttpError(400, "Unknown role.")
+    return _result(service.login(role, username, password))
+
+
+def logout(session, match, query, body):
+    auth.logout(session[2])
+    return 200, {"ok": True, "message": "Logged out."}
+
+
+def apply_leave(session, match, query, body):
+    from_date, to_date, leave_type, reason = _require(body, "from_date", "to_date", "leave_type", "reason")
+    return _result(service.apply_leave(session[1], from_date, to_date, leave_type.capitalize(), reason))
+
+
+def submit_leave(session, match, query, body):
+    # Write-behind variant of POST /leaves: answers 202 with a receipt to poll.
+    from_date, to_date, leave_type, reason = _require(body, "from_date", "to_date", "leave_type", "reason")
+    result = submissions.submit(session[1], from_date, to_date, leave_type.capitalize(), reason)
+    if not result.ok:
+        return _result(result)
+    return 202, {"ok": True, "message": result.message, "data": result.data}
+
+
+def submission_status(session, match, query, body):
+    receipt = submissions.status(match["receipt"])
+    if receipt is None or receipt["emp_code"] != session[1]:
+        raise HttpError(404, "Unknown receipt.")
+    return 200, {"ok": True, "data": receipt}
+
+
+def leave_history(session, match, query, body):
+    return 200, {"ok": True, "data": service.leave_history(session[1])}
+
+
+def cancel_leave(session, match, query, body):
+    return _result(service.cancel_leave(session[1], int(match["leave_id"])))
+
+
+def pending_leaves(session, match, query, body):
+    return 200, {"ok": True, "data": service.pending_leaves(_dept_id(session))}
+
+
+def inbox(session, match, query, body):
+    return 200, {"ok": True, "data": service.inbox_summary(_dept_id(session))}
+
+
+def inbox_changes(session, match, query, body):
+    try:
+        cursor = int(query.get("cursor", ["0"])[0])
+        limit = min(int(query.get("limit", ["500"])[0]), 1000)
+    except ValueError:
+        raise HttpError(400, "cursor and limit must be integers.")
+    return 200, {"ok": True, "data": service.inbox_changes(_dept_id(session), cursor, limit)}
+
+
+def _decisions(body):
+    decisions = body.get("decisions")
+    if not isinstance(decisions, list):
+        raise HttpError(400, "decisions must be a list of [leave_id, approve] pairs.")
+    try:
+        pairs = [(int(leave_id), approve) for leave_id, approve in decisions]
+    except (TypeError, ValueError):
+        raise HttpError(400, "decisions must be a list of [leave_id, approve] pairs.")
+    if not all(isinstance(approve, bool) for _, approve in pairs):
+        raise HttpError(400, "approve must be true or false.")
+    return pairs
+
+
+def decide_leaves(session, match, query, body):
+    return _result(service.decide_leaves(_dept_id(session), _decisions(body), session[1]))
+
+
+def _flag(body, key, default):
+    # JSON booleans only: bool("false") would be True.
+    value = body.get(key, default)
+    if not isinstance(value, bool):
+        raise HttpError(400, f"{key} must be true or false.")
+    return value
+
+
+def auto_approve(session, match, query, body):
+    leave_type = body.get("leave_type", "Casual")
+    max_days = body.get("max_days", 1)
+    if leave_type is not None and not isinstance(leave_type, str):
+        raise HttpError(400, "leave_type must be a string or null.")
+    if max_days is not None and (isinstance(max_days, bool) or not isinstance(max_days, int) or max_days < 1):
+        raise HttpError(400, "max_days must be a positive integer or null.")
+    return _result(service.auto_approve(_dept_id(session), leave_type and leave_type.capitalize(), max_days,
+                                        _flag(body, "require_balance", True), session[1]))
+
+
+def all_leaves(session, match, query, body):
+    filters = {key: query[key][0] for key in ("dept_id", "status", "emp_code", "from_date", "to_date")
+               if key in query}
+    try:
+        after = json.loads(query["after"][0]) if "after" in query else None
+        limit = min(int(query.get("limit", ["100"])[0]), 1000)
+    except ValueError:
+        raise HttpError(400, "after must be a JSON cursor and limit an integer.")
+    if after is not None and not (isinstance(after, list) and len(after) == 3 and isinstance(after[0], str)
+                                  and isinstance(after[1], str) and isinstance(after[2], int)):
+        raise HttpError(400, "after must be the next cursor of a previous page.")
+    if limit < 1:
+        raise HttpError(400, "limit must be positive.")
+    rows, cursor = service.leave_page(after, limit, **filters)
+    return 200, {"ok": True, "data": rows, "next": cursor}
+
+
+def head_leaves(session, match, query, body):
+    return 200, {"ok": True, "data": service.head_pending_leaves()}
+
+
+def decide_head_leaves(session, match, query, body):
+    return _result(service.decide_head_leaves(_decisions(body), session[1]))
+
+
+def leave_events(session, match, query, body):
+    return 200, {"ok": True, "data": events.history(int(match["leave_id"]))}
+
+
+def leave_report(session, match, query, body):
+    from_month, to_month = (query.get(key, [None])[0] for key in ("from_month", "to_month"))
+    for month in (from_month, to_month):
+        if month is not None and not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+            raise HttpError(400, "from_month and to_month must be YYYY-MM.")
+    return 200, {"ok": True, "data": analytics.leave_report(from_month, to_month)}
+
+
+def create_department(session, match, query, body):
+    return _result(service.create_department(*_require(body, "dept_id", "dept_name")))
+
+
+def create_employee(session, match, query, body):
+    fields = _require(body, "emp_code", "name", "department", "dept_id", "designation", "post", "join_date",
+                      "password")
+    is_head = _flag(body, "is_head", False)
+    hr_name = service.get_hr(session[1])[1]
+    return _result(service.create_employee(hr_name, *fields, is_head=is_head))
+
+
+def change_password(session, match, query, body):
+    current, new = _require(body, "current_password", "new_password")
+    return _result(service.change_password(service.ROLE_TABLES[session[0]], session[1], current, new))
+
+
+def metrics(session, match, query, body):
+    # Prometheus text when profiling is on; service cache counters either way.
+    lines = [profiling.prometheus_text()] if profiling.ENABLED else []
+    lines.append("# HELP leave_mgmt_cache_requests_total Metadata cache lookups.")
+    lines.append("# TYPE leave_mgmt_cache_requests_total counter")
+    for name, stats in sorted(service.cache_stats().items()):
+        lines.append(f'leave_mgmt_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+        lines.append(f'leave_mgmt_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+    return 200, "\n".join(lines) + "\n"
+
+
+# (method, path pattern, handler, roles allowed or None for anonymous, executor)
+ROUTES = [
+    ("POST", r"/login", login, None, "auth"),
+    ("POST", r"/logout", logout, ("hr", "employee", "head"), "read"),
+    ("GET", r"/leaves", leave_history, ("employee", "head"), "read"),
+    ("POST", r"/leaves", apply_leave, ("employee", "head"), "write"),
+    ("POST", r"/leaves/submissions", submit_leave, ("employee", "head"), "submit"),
+    ("GET", r"/leaves/submissions/(?P<receipt>[\w-]+)", submission_status, ("employee", "head"), "read"),
+    ("POST", r"/leaves/(?P<leave_id>\d+)/cancel", cancel_leave, ("employee", "head"), "write"),
+    ("POST", r"/password", change_password, ("employee", "head"), "write"),
+    ("GET", r"/head/pending", pending_leaves, ("head",), "read"),
+    ("GET", r"/head/inbox", inbox, ("head",), "read"),
+    ("GET", r"/head/inbox/changes", inbox_changes, ("head",), "watch"),
+    ("POST", r"/head/decisions", decide_leaves, ("head",), "write"),
+    ("POST", r"/head/auto-approve", auto_approve, ("head",), "write"),
+    ("GET", r"/hr/leaves", all_leaves, ("hr",), "read"),
+    ("GET", r"/hr/leaves/(?P<leave_id>\d+)/events", leave_events, ("hr",), "read"),
+    ("GET", r"/hr/head-leaves", head_leaves, ("hr",), "read"),
+    ("POST", r"/hr/head-leaves/decisions", decide_head_leaves, ("hr",), "write"),
+    ("GET", r"/hr/reports", leave_report, ("hr",), "read"),
+    ("POST", r"/hr/departments", create_department, ("hr",), "write"),
+    ("POST", r"/hr/employees", create_employee, ("hr",), "write"),
+    ("GET", r"/hr/metrics", metrics, ("hr",), "read"),
+]
+ROUTES = [(method, re.compile(pattern + "$"), handler, roles, kind) for method, pattern, handler, roles, kind in ROUTES]
+
+
+class LeaveServer:
+    def __init__(self, read_workers=READ_WORKERS, auth_workers=AUTH_WORKERS, queue=False):
+        # Reads run on a pool so they proceed alongside WAL writes; writes are
+        # funnelled through one thread so they never contend for the write lock.
+        # Logins get their own pool so a burst of KDF work cannot starve reads.
+        # Queued submissions only touch the spool, so they skip the write
+        # thread; the queue's own writer applies them in batches.
+        self.executors = {
+            "read": ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="leave-read"),
+            "write": ThreadPoolExecutor(max_workers=1, thread_name_prefix="leave-write"),
+            "auth": ThreadPoolExecutor(max_workers=auth_workers, thread_name_prefix="leave-auth"),
+            "submit": ThreadPoolExecutor(max_workers=SUBMIT_WORKERS, thread_name_prefix="leave-submit"),
+        }
+        self.loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self.writer = None
+        if queue:
+            self.writer = submissions.Writer(on_batch=lambda: self.loop.call_soon_threadsafe(self.notify))
+            self.writer.start()
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        if self.writer is not None:
+            self.writer.stop()
+
+    def notify(self):
+        # Wakes long polls after a write; runs on the event loop.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def watch(self, handler, session, match, query, payload):
+        # Long poll (?wait=seconds): re-runs the read after each write until
+        # it reports changes or a reset, or the wait runs out.
+        try:
+            wait = min(float(query.get("wait", ["0"])[0]), MAX_WATCH_SECONDS)
+        except ValueError:
+            raise HttpError(400, "wait must be a number of seconds.")
+        deadline = self.loop.time() + wait
+        while True:
+            # Taken before the read, so a write that lands during it still wakes us.
+            changed = self._changed
+            status, result = await self.loop.run_in_executor(self.executors["read"], handler, session, match,
+                                                             query, payload)
+            remaining = deadline - self.loop.time()
+            if status != 200 or result["data"]["changes"] or result["data"]["reset"] or remaining <= 0:
+                return status, result
+            try:
+                await asyncio.wait_for(changed.wait(), min(remaining, WATCH_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, handler, roles, kind in ROUTES:
+            if kind == "submit" and self.writer is None:
+                continue
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return match, handler, roles, kind
+                allowed = True
+        raise HttpError(405 if allowed else 404, "Method not allowed." if allowed else "Not found.")
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        match, handler, roles, kind = self._route(method, url.path)
+        session = None
+        if roles is not None:
+            token = headers.get("authorization", "").removeprefix("Bearer ").strip()
+            resolved = auth.resolve(token)
+            if resolved is None:
+                raise HttpError(401, "Login required.")
+            if resolved[0] not in roles:
+                raise HttpError(403, "Not allowed for this role.")
+            session = (*resolved, token)
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            raise HttpError(400, "Body must be JSON.")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Body must be a JSON object.")
+        if kind == "watch":
+            return await self.watch(handler, session, match, parse_qs(url.query), payload)
+        response = await self.loop.run_in_executor(self.executors[kind], handler, session, match,
+                                                   parse_qs(url.query), payload)
+        if kind == "write":
+            self.notify()
+        return response
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                try:
+                    if length > MAX_BODY:
+                        raise HttpError(413, "Request body too large.")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.dispatch(method, target, headers, body)
+                except HttpError as e:
+                    status, payload = e.status, {"ok": False, "message": str(e)}
+                except asyncio.IncompleteReadError:
+                    return
+                except Exception as e:
+                    status, payload = 500, {"ok": False, "message": f"Internal error: {e}"}
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=8080, read_workers=READ_WORKERS, ready=None, queue=False):
+    app = LeaveServer(read_workers, queue=queue)
+    server = await asyncio.start_server(app.handle, host, port, backlog=1024)
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.close()
+
+
+def pool_size(read_workers=READ_WORKERS):
+    # One pooled connection per worker thread, plus the write thread's and
+    # the queue writer's.
+    return read_workers + AUTH_WORKERS + SUBMIT_WORKERS + 2
+
+
+def run(host="127.0.0.1", port=8080, read_workers=READ_WORKERS, queue=False):
+    db.configure(size=pool_size(read_workers))
+    print(f"Serving leave management API on http://{host}:{port}")
+    try:
+        asyncio.run(serve(host, port, read_workers, queue=queue))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+import datetime
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import db
+import leave_service as service
+import profiling
+from leave_service import Result
+
+# Write-behind path for leave applications. submit() runs the lock-free
+# checks, spools the request in its own small database and hands back a
+# receipt; one Writer drains the spool in batches, each applied in a single
+# write transaction per shard where overlap, quota and balance are checked as
+# in apply_leave().
+SPOOL_PATH = os.environ.get("LEAVE_MGMT_SPOOL_DB")
+BATCH_SIZE = 256
+# Idle writers look for requests spooled by other processes this often.
+POLL_SECONDS = 1.0
+# Decided receipts (and SubmissionReceipt rows) older than this are dropped.
+KEEP_DAYS = 7
+PURGE_SECONDS = 60 * 60
+
+_SPOOL_SCHEMA = '''CREATE TABLE IF NOT EXISTS Submission (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt TEXT NOT NULL UNIQUE,
+    emp_code TEXT NOT NULL,
+    request TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    message TEXT,
+    result TEXT,
+    submitted_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    decided_at TEXT
+)'''
+
+_local = threading.local()
+_wakeup = threading.Event()
+
+
+def spool_path():
+    return SPOOL_PATH or os.path.splitext(db.DB_PATH)[0] + "-spool.db"
+
+
+def _spool():
+    # One connection per thread, reopened if the spool path changes.
+    path = spool_path()
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != path:
+        conn = sqlite3.connect(path, timeout=db.BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # A receipt handed to a client has to survive a power cut, not just a crash.
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(_SPOOL_SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_submission_queued ON Submission(seq) WHERE status='queued'")
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+@profiling.timed
+def submit(emp_code, from_date, to_date, leave_type, reason, today=None):
+    # Returns the receipt once the request is durably spooled. Requests the
+    # lock-free checks already refuse are answered straight away instead.
+    today = today or datetime.date.today()
+    checked = service.check_application(emp_code, from_date, to_date, leave_type, reason, today)
+    if not checked.ok:
+        return checked
+    application = checked.data
+    request = {"from_date": application.from_dt.isoformat(), "to_date": application.to_dt.isoformat(),
+               "leave_type": leave_type, "reason": reason, "today": today.isoformat()}
+    receipt = secrets.token_urlsafe(16)
+    _spool().execute("INSERT INTO Submission (receipt, emp_code, request) VALUES (?, ?, ?)",
+                     (receipt, emp_code, json.dumps(request)))
+    _wakeup.set()
+    return Result(True, "Leave application queued.", {"receipt": receipt, "status": "queued"})
+
+
+def status(receipt):
+    # {"receipt", "emp_code", "status", "message", "data", ...} or None.
+    # status is 'queued', 'accepted' (data holds the leave) or 'rejected'.
+    row = _spool().execute('''SELECT receipt, emp_code, status, message, result, submitted_at, decided_at
+                              FROM Submission WHERE receipt=?''', (receipt,)).fetchone()
+    if row is None:
+        return None
+    return {"receipt": row[0], "emp_code": row[1], "status": row[2], "message": row[3],
+            "data": json.loads(row[4]) if row[4] else None, "submitted_at": row[5], "decided_at": row[6]}
+
+
+def _decide(cur, receipt, emp_code, request):
+    done = cur.execute("SELECT leave_id FROM SubmissionReceipt WHERE receipt=?", (receipt,)).fetchone()
+    if done:
+        # Committed before a crash that kept the spool from hearing about it.
+        return receipt, "accepted", "Leave Applied.", {"leave_id": done[0]}
+    request = json.loads(request)
+    today = service.parse_date(request.pop("today"))
+    # Checked again: the person may have been relieved while the request waited.
+    result = service.check_application(emp_code, **request, today=today)
+    if result.ok:
+        result = service.record_application(cur, result.data, today)
+    if result.ok:
+        cur.execute("INSERT INTO SubmissionReceipt (receipt, leave_id) VALUES (?, ?)",
+                    (receipt, result.data["leave_id"]))
+    return receipt, "accepted" if result.ok else "rejected", result.message, result.data
+
+
+def _apply(rows):
+    # Group commit: the whole batch in one write transaction, so it waits for
+    # the write lock and commits once. Requests later in the batch see the
+    # leaves accepted before them.
+    try:
+        with db.transaction() as cur:
+            return [_decide(cur, *row) for row in rows]
+    except sqlite3.OperationalError:
+        # Locked or out of space: leave the batch queued for the next pass.
+        raise
+    except sqlite3.Error:
+        pass
+    # Something in the batch failed outright; retry one per transaction so
+    # only that request is rejected.
+    decided = []
+    for receipt, emp_code, request in rows:
+        try:
+            with db.transaction() as cur:
+                decided.append(_decide(cur, receipt, emp_code, request))
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error as e:
+            decided.append((receipt, "rejected", f"Error applying leave: {e}", None))
+    return decided
+
+
+@profiling.timed
+def process_batch(limit=BATCH_SIZE):
+    # Applies up to `limit` queued requests in spool order; returns how many
+    # were decided. Safe to run from several processes: a request applied
+    # twice finds its SubmissionReceipt and is not inserted again.
+    spool = _spool()
+    rows = spool.execute('''SELECT receipt, emp_code, request FROM Submission
+                            WHERE status='queued' ORDER BY seq LIMIT ?''', (limit,)).fetchall()
+    if not rows:
+        return 0
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(service.person_shard(row[1]), []).append(row)
+    decided = []
+    for shard, shard_rows in by_shard.items():
+        with db.use_shard(shard):
+            decided += _apply(shard_rows)
+    spool.execute("BEGIN IMMEDIATE")
+    try:
+        spool.executemany('''UPDATE Submission SET status=?, message=?, result=?, decided_at=CURRENT_TIMESTAMP
+                             WHERE status='queued' AND receipt=?''',
+                          [(state, message, None if data is None else json.dumps(data), receipt)
+                           for receipt, state, message, data in decided])
+    except BaseException:
+        spool.rollback()
+        raise
+    spool.commit()
+    return len(decided)
+
+
+def drain(limit=BATCH_SIZE):
+    # Applies everything queued so far; returns how many were decided.
+    total = 0
+    while True:
+        count = process_batch(limit)
+        total += count
+        if count < limit:
+            return total
+
+
+def purge(keep_days=KEEP_DAYS):
+    cutoff = f"-{keep_days} days"
+    spool = _spool()
+    spool.execute("DELETE FROM Submission WHERE status != 'queued' AND decided_at < datetime('now', ?)", (cutoff,))
+    for shard in db.shard_names():
+        with db.transaction(shard=shard) as cur:
+            cur.execute("DELETE FROM SubmissionReceipt WHERE created_at < datetime('now', ?)", (cutoff,))
+
+
+class Writer:
+    # The single consumer of the spool. submit() in this process wakes it at
+    # once; requests spooled elsewhere are picked up within poll_seconds.
+    # Batches form on their own while the previous one commits. on_batch()
+    # is called from the writer thread after each batch that decided something.
+    def __init__(self, batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS, on_batch=None):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.on_batch = on_batch
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="leave-submissions", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        # Finishes the batch in hand; anything still queued stays spooled.
+        self._stopping.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        purged = 0.0
+        while not self._stopping.is_set():
+            _wakeup.clear()
+            try:
+                count = process_batch(self.batch_size)
+                if count and self.on_batch is not None:
+                    self.on_batch()
+                if count == 0 and time.monotonic() - purged > PURGE_SECONDS:
+                    purge()
+                    purged = time.monotonic()
+            except sqlite3.Error:
+                # Back off rather than spin while the database is unavailable.
+                self._stopping.wait(self.poll_seconds)
+                continue
+            if count < self.batch_size:
+                _wakeup.wait(self.poll_seconds)
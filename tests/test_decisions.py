@@ -0,0 +1,77 @@
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import leave_service as service
+from schema import create_tables
+
+
+class HeadLeaveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db.configure(os.path.join(self.tmp.name, "test.db"))
+        service.invalidate_metadata()
+        create_tables()
+        self.assertTrue(service.create_department("D001", "Testing").ok)
+        join_date = (datetime.date.today() - datetime.timedelta(days=800)).isoformat()
+        for emp_code, name, is_head in (("100001", "Head One", True), ("200001", "Emp One", False)):
+            result = service.create_employee("hr", emp_code, name, "Testing", "D001", "Dev", "Staff", join_date,
+                                             "secret", is_head=is_head)
+            self.assertTrue(result.ok, result.message)
+        start = datetime.date.today() + datetime.timedelta(days=30)
+        # The default work week has Saturday and Sunday off.
+        while start.weekday() >= 5:
+            start += datetime.timedelta(days=1)
+        self.own = self._apply("100001", start)
+        self.other = self._apply("200001", start)
+
+    def tearDown(self):
+        db.close_pool()
+        service.invalidate_metadata()
+        self.tmp.cleanup()
+
+    def _apply(self, emp_code, day):
+        result = service.apply_leave(emp_code, day.isoformat(), day.isoformat(), "Casual", "Personal")
+        self.assertTrue(result.ok, result.message)
+        return result.data["leave_id"]
+
+    def _status(self, leave_id):
+        with db.connection() as conn:
+            return conn.execute("SELECT status FROM Leave WHERE leave_id=?", (leave_id,)).fetchone()[0]
+
+    def test_head_cannot_decide_own_leave(self):
+        result = service.decide_leave("D001", self.own, True, actor="100001")
+        self.assertFalse(result.ok)
+        self.assertEqual(self._status(self.own), "pending")
+
+    def test_bulk_decision_skips_own_leave(self):
+        result = service.decide_leaves("D001", [(self.own, True), (self.other, True)], "100001")
+        self.assertEqual(result.data["approved"], [self.other])
+        self.assertEqual(result.data["skipped"], [self.own])
+        self.assertEqual(self._status(self.own), "pending")
+
+    def test_auto_approve_skips_own_leave(self):
+        result = service.auto_approve("D001", actor="100001")
+        self.assertEqual(result.data["approved"], [self.other])
+        self.assertEqual(self._status(self.own), "pending")
+
+    def test_head_leave_stays_out_of_inbox(self):
+        self.assertEqual([row[0] for row in service.pending_leaves("D001")], [self.other])
+        self.assertEqual(service.inbox_summary("D001")["total"], 1)
+
+    def test_hr_decides_head_leave(self):
+        self.assertEqual([row[0] for row in service.head_pending_leaves()], [self.own])
+        result = service.decide_head_leaves([(self.own, True), (self.other, True)], "HR0001")
+        self.assertEqual(result.data["approved"], [self.own])
+        self.assertEqual(result.data["skipped"], [self.other])
+        self.assertEqual(self._status(self.own), "approved")
+        self.assertEqual(self._status(self.other), "pending")
+
+
+if __name__ == "__main__":
+    unittest.main()
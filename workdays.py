@@ -0,0 +1,91 @@
+import datetime
+import threading
+from array import array
+
+from db import current_shard
+from schema import change_counters
+
+ALL_DEPARTMENTS = "*"
+# Extra days built on each side of a requested range, so nearby lookups
+# don't trigger another rebuild.
+PADDING = 366
+
+
+class WorkCalendar:
+    # prefix[i] is the number of working days in [start, start + i), so any
+    # range inside the built window is counted with two lookups.
+    def __init__(self, weekly_offs, holidays):
+        self.weekly_offs = frozenset(weekly_offs)
+        self.holidays = frozenset(holidays)
+        # (start, end, prefix) swapped as one object so readers on other
+        # threads never mix a new start with an old array.
+        self._window = None
+
+    def _build(self, first, last):
+        prefix = array("i", [0])
+        total = 0
+        for ordinal in range(first, last + 1):
+            # date.weekday() is (ordinal + 6) % 7, Monday = 0.
+            if (ordinal + 6) % 7 not in self.weekly_offs and ordinal not in self.holidays:
+                total += 1
+            prefix.append(total)
+        self._window = (first, last, prefix)
+        return self._window
+
+    def count(self, first, last):
+        # Working days in the inclusive ordinal range [first, last].
+        if last < first:
+            return 0
+        window = self._window
+        if window is None:
+            window = self._build(first - PADDING, last + PADDING)
+        elif first < window[0] or last > window[1]:
+            window = self._build(min(first, window[0]) - PADDING, max(last, window[1]) + PADDING)
+        start, _, prefix = window
+        return prefix[last - start + 1] - prefix[first - start]
+
+    def is_working_day(self, ordinal):
+        return self.count(ordinal, ordinal) == 1
+
+
+# shard -> ('Calendar' counter, {dept_id: WorkCalendar})
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def _load(cur, dept_id):
+    offs = dict(cur.execute("SELECT scope, weekly_offs FROM WorkWeek WHERE scope IN (?, ?)",
+                            (dept_id, ALL_DEPARTMENTS)))
+    weekly_offs = offs.get(dept_id, offs.get(ALL_DEPARTMENTS, ""))
+    holidays = [datetime.date.fromisoformat(row[0]).toordinal() for row in cur.execute(
+        "SELECT holiday_date FROM Holiday WHERE scope IN (?, ?)", (dept_id, ALL_DEPARTMENTS))]
+    return WorkCalendar([int(day) for day in weekly_offs.split(",") if day], holidays)
+
+
+def calendar_for(cur, dept_id):
+    # Calendars are cached per shard and department until a holiday or
+    # weekly-off change moves that shard's 'Calendar' counter. cur must
+    # belong to the current shard.
+    shard = current_shard()
+    counter = change_counters(cur, "Calendar")["Calendar"]
+    with _calendars_lock:
+        cached = _calendars.get(shard)
+        if cached is None or cached[0] != counter:
+            cached = _calendars[shard] = (counter, {})
+        calendar = cached[1].get(dept_id)
+    if calendar is None:
+        calendar = _load(cur, dept_id)
+        with _calendars_lock:
+            calendar = cached[1].setdefault(dept_id, calendar)
+    return calendar
+
+
+def _ordinal(value):
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return value.toordinal()
+
+
+def working_days(cur, dept_id, from_date, to_date):
+    # Inclusive count of working days; dates are ISO strings or date objects.
+    return calendar_for(cur, dept_id).count(_ordinal(from_date), _ordinal(to_date))